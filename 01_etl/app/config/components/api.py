@@ -0,0 +1,15 @@
+"""API constants."""
+
+import os
+
+# Размер страницы /api/v1/movies/.
+MOVIES_PAGE_SIZE = int(os.environ.get('MOVIES_PAGE_SIZE', 50))
+
+# Время хранения точного количества фильмов в кэше, секунд.
+MOVIES_COUNT_CACHE_TIMEOUT = int(os.environ.get('MOVIES_COUNT_CACHE_TIMEOUT', 60))
+
+# Время хранения ответов API в кэше, секунд; ответы также сбрасываются при изменении каталога.
+MOVIES_CACHE_TIMEOUT = int(os.environ.get('MOVIES_CACHE_TIMEOUT', 300))
+
+# Количество фильмов, читаемых серверным курсором за раз при выгрузке /api/v1/movies/export/.
+MOVIES_EXPORT_CHUNK_SIZE = int(os.environ.get('MOVIES_EXPORT_CHUNK_SIZE', 2000))
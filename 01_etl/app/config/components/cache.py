@@ -0,0 +1,30 @@
+"""Cache constants."""
+
+import os
+
+# Redis для кэша API, например, 'redis://redis:6379/1'; без него - кэш в памяти процесса.
+# Кэш в памяти годится только для разработки: сброс кэша при изменении каталога (movies.cache)
+# виден лишь процессу, где произошло изменение, остальные процессы uwsgi отдают прежние ответы
+# до истечения MOVIES_CACHE_TIMEOUT. При нескольких процессах задайте CACHE_REDIS_URL.
+CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL')
+
+if CACHE_REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django_redis.cache.RedisCache',
+            'LOCATION': CACHE_REDIS_URL,
+            'OPTIONS': {
+                'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+                # Недоступный Redis не ломает API: ответы формируются из базы.
+                'IGNORE_EXCEPTIONS': True,
+            },
+            'KEY_PREFIX': 'admin_panel',
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'admin_panel',
+        },
+    }
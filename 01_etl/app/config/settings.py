@@ -22,4 +22,8 @@ include(
     'components/static.py',
     # LOGGING
     'components/log_settings.py',
+    # CACHE_REDIS_URL, CACHES
+    'components/cache.py',
+    # MOVIES_PAGE_SIZE, MOVIES_COUNT_CACHE_TIMEOUT, MOVIES_CACHE_TIMEOUT, MOVIES_EXPORT_CHUNK_SIZE
+    'components/api.py',
 )
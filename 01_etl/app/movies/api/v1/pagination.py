@@ -0,0 +1,174 @@
+"""Пагинация /api/v1/movies/: курсоры по (title, id) и дешёвый подсчёт фильмов."""
+
+import base64
+import binascii
+import json
+import math
+import uuid
+from typing import Any, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import BadRequest
+from django.core.paginator import Paginator
+from django.db import connection
+from django.db.models import Q, QuerySet
+from movies.cache import get_generation
+from movies.models import Filmwork
+
+COUNT_CACHE_KEY = 'movies:api:v1:count'
+COUNT_MODES = ('exact', 'estimate', 'none')
+
+# Ключ сортировки курсора; совпадает с индексом fw_title_id_idx.
+CURSOR_ORDERING = ('title', 'id')
+
+
+def encode_cursor(row: dict[str, Any]) -> str:
+    """Непрозрачный курсор на запись, после которой начинается следующая страница.
+
+    Args:
+        row: Последняя запись страницы.
+
+    Returns:
+        str: Курсор в base64 (urlsafe, без '=').
+    """
+    position = [str(row[field]) for field in CURSOR_ORDERING]
+    token = base64.urlsafe_b64encode(json.dumps(position, ensure_ascii=False).encode('utf-8'))
+    return token.decode('ascii').rstrip('=')
+
+
+def decode_cursor(token: str) -> dict[str, str]:
+    """Разбор курсора.
+
+    Args:
+        token: Курсор из encode_cursor.
+
+    Returns:
+        dict: Значения полей CURSOR_ORDERING.
+
+    Raises:
+        BadRequest: Курсор повреждён: не JSON-список (title, id), title не строка или id не UUID.
+    """
+    try:
+        position = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except (binascii.Error, ValueError) as er:
+        raise BadRequest('Invalid cursor') from er
+    if not isinstance(position, list) or len(position) != len(CURSOR_ORDERING):
+        raise BadRequest('Invalid cursor')
+    title, film_work_id = position
+    if not isinstance(title, str) or not isinstance(film_work_id, str):
+        raise BadRequest('Invalid cursor')
+    try:
+        uuid.UUID(film_work_id)
+    except ValueError as er:
+        raise BadRequest('Invalid cursor') from er
+    return dict(zip(CURSOR_ORDERING, position))
+
+
+def paginate_by_cursor(queryset: QuerySet, token: str, page_size: int) -> tuple[list[dict], Optional[str]]:
+    """Страница после курсора.
+
+    Условие title >= %s служит границей сканирования индекса (title, id), поэтому
+    время запроса не зависит от номера страницы, в отличие от OFFSET.
+
+    Args:
+        queryset: Фильмы из MoviesApiMixin.get_queryset.
+        token: Курсор; пустая строка - первая страница.
+        page_size: Размер страницы.
+
+    Returns:
+        tuple: Фильмы страницы и курсор следующей страницы (None - страница последняя).
+    """
+    queryset = queryset.order_by(*CURSOR_ORDERING)
+    if token:
+        position = decode_cursor(token)
+        queryset = queryset.filter(
+            Q(title__gte=position['title']),
+            Q(title__gt=position['title']) | Q(id__gt=position['id']),
+        )
+    results = list(queryset[:page_size + 1])
+    if len(results) <= page_size:
+        return results, None
+    results = results[:page_size]
+    return results, encode_cursor(results[-1])
+
+
+def get_estimated_count() -> int:
+    """Оценка количества фильмов по статистике планировщика (pg_class.reltuples).
+
+    Returns:
+        int: Оценка; точное значение, если таблица ещё не анализировалась.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+            [f'"{Filmwork._meta.db_table}"'],
+        )
+        row = cursor.fetchone()
+    if row is None or row[0] < 0:
+        return get_exact_count()
+    return row[0]
+
+
+def get_exact_count() -> int:
+    """Количество фильмов, кэшируется на MOVIES_COUNT_CACHE_TIMEOUT секунд или до изменения каталога.
+
+    Returns:
+        int: Количество фильмов.
+    """
+    return cache.get_or_set(
+        COUNT_CACHE_KEY,
+        Filmwork.objects.count,
+        settings.MOVIES_COUNT_CACHE_TIMEOUT,
+        version=get_generation(),
+    )
+
+
+def get_count(mode: str) -> Optional[int]:
+    """Количество фильмов для ответа API.
+
+    Args:
+        mode: 'exact' | 'estimate' | 'none'.
+
+    Returns:
+        int: Количество фильмов; None для mode='none'.
+
+    Raises:
+        BadRequest: Неизвестный mode.
+    """
+    if mode not in COUNT_MODES:
+        raise BadRequest(f'count must be one of {COUNT_MODES}')
+    if mode == 'exact':
+        return get_exact_count()
+    if mode == 'estimate':
+        return get_estimated_count()
+    return None
+
+
+def get_total_pages(count: Optional[int], page_size: int) -> Optional[int]:
+    """Количество страниц.
+
+    Args:
+        count: Количество фильмов.
+        page_size: Размер страницы.
+
+    Returns:
+        int: Количество страниц, не меньше 1; None, если количество фильмов не считалось.
+    """
+    if count is None:
+        return None
+    return max(math.ceil(count / page_size), 1)
+
+
+class CountedPaginator(Paginator):
+    """Paginator с количеством записей, посчитанным заранее (get_count)."""
+
+    def __init__(self, *args, known_count: int, **kwargs) -> None:
+        """
+        Args:
+            args: Аргументы Paginator.
+            known_count: Количество записей.
+            kwargs: Аргументы Paginator.
+        """
+        super().__init__(*args, **kwargs)
+        self.count = known_count
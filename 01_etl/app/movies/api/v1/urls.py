@@ -5,5 +5,6 @@ from movies.api.v1 import views
 
 urlpatterns = [
     path('movies/', views.MoviesListApi.as_view()),
+    path('movies/export/', views.MoviesExportApi.as_view()),
     path('movies/<uuid:pk>/', views.MoviesDetailApi.as_view()),
 ] 
\ No newline at end of file
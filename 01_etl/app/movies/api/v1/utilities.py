@@ -19,8 +19,8 @@ class MovieContextType(TypedDict):
 class MoviesContextType(TypedDict):
     """TypedDict."""
 
-    count: int
-    total_pages: int
+    count: None | int
+    total_pages: None | int
     prev: None | int
-    next: None | int
+    next: None | int | str
     results: list[MovieContextType]
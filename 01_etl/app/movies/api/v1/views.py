@@ -1,20 +1,111 @@
-from typing import Any
+import hashlib
+import json
+from datetime import datetime
+from http import HTTPStatus
+from typing import Any, Iterator, Optional
 
-from django.contrib.postgres.aggregates import ArrayAgg
-from django.db.models import Q, QuerySet
-from django.http import JsonResponse
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import BadRequest
+from django.core.paginator import Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.db.models import F, QuerySet
+from django.http import HttpRequest, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.dateparse import parse_datetime
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.http import condition
 from django.views.generic.detail import BaseDetailView
 from django.views.generic.list import BaseListView
-from movies.models import Filmwork, RoleType
+from movies.cache import get_generation, get_last_modified
+from movies.models import Filmwork
 
+from .pagination import CountedPaginator, get_count, get_exact_count, get_total_pages, paginate_by_cursor
 from .utilities import MovieContextType, MoviesContextType
 
+# Страница журнала удалений с keyset-пагинацией по (modified, id) и индексу fw_deleted_modified_id_idx;
+# первая страница включает границу (>=), следующие начинаются после последней записи (>).
+# restored - фильм с этим id создан заново; такие записи пропускаются, но сдвигают позицию страницы.
+DELETED_PAGE_SQL = """
+    SELECT
+        page.id,
+        page.modified,
+        EXISTS (SELECT 1 FROM content.film_work fw WHERE fw.id = page.id) AS restored
+    FROM (
+        SELECT d.id, d.modified
+        FROM content.film_work_deleted d
+        WHERE (d.modified, d.id) {comparison} (%s::timestamptz, %s::uuid)
+        ORDER BY d.modified, d.id
+        LIMIT %s
+    ) page
+    ORDER BY page.modified, page.id
+"""
+MIN_UUID = '00000000-0000-0000-0000-000000000000'
+
+
+def is_cacheable(request: HttpRequest) -> bool:
+    """Зависит ли ответ API только от поколения каталога.
+
+    Ответ с ?count=estimate содержит оценку pg_class.reltuples, которая меняется без смены поколения,
+    поэтому такой ответ не кэшируется и не получает ETag и Last-Modified.
+
+    Args:
+        request: Запрос.
+
+    Returns:
+        bool: Ответ можно кэшировать по поколению каталога.
+    """
+    return request.GET.get('count') != 'estimate'
+
+
+def get_etag(request: HttpRequest, *args, **kwargs) -> Optional[str]:
+    """ETag ответа API: поколение каталога, ответы одного URL в пределах поколения совпадают.
+
+    Args:
+        request: Запрос.
+        args: Аргументы URL.
+        kwargs: Аргументы URL.
+
+    Returns:
+        str: ETag; None, если ответ не кэшируется (is_cacheable).
+    """
+    if not is_cacheable(request):
+        return None
+    return f'"movies-{get_generation()}"'
+
+
+def get_modified(request: HttpRequest, *args, **kwargs) -> Optional[datetime]:
+    """Last-Modified ответа API: время последнего изменения каталога.
+
+    Args:
+        request: Запрос.
+        args: Аргументы URL.
+        kwargs: Аргументы URL.
+
+    Returns:
+        datetime: Время изменения; None, если ответ не кэшируется (is_cacheable).
+    """
+    if not is_cacheable(request):
+        return None
+    return get_last_modified()
+
+
+conditional = method_decorator(condition(etag_func=get_etag, last_modified_func=get_modified), name='dispatch')
+
 
 class MoviesApiMixin:  # noqa: WPS306
-    """Миксин для классов MoviesListApi и MoviesDetailApi."""
+    """Миксин для классов MoviesListApi и MoviesDetailApi.
+
+    Жанры и участники фильма читаются из content.film_work_document (FilmworkDocument),
+    которую поддерживают триггеры базы данных, по первичному ключу, без агрегации.
+    Ответы кэшируются с версией, равной поколению каталога (movies.cache), поэтому
+    после изменения фильмов, жанров или участников прежние ответы не используются.
+    """
 
     model = Filmwork
     http_method_names = ['get']
+    fields = ('id', 'title', 'description', 'creation_date', 'rating', 'type')
 
     def get_queryset(self) -> QuerySet:
         """Метод возвращает подготовленный QuerySet.
@@ -22,21 +113,38 @@ class MoviesApiMixin:  # noqa: WPS306
         Returns:
             queryset: объект QuerySet
         """
-        queryset = self.model.objects.all().prefetch_related('genres', 'persons').values(
-            'id',
-            'title',
-            'description',
-            'creation_date',
-            'rating',
-            'type',
-        ).annotate(
-            genres=ArrayAgg('genres__name', distinct=True),
-            actors=ArrayAgg('persons__full_name', filter=Q(personfilmwork__role=RoleType.ACTOR), distinct=True),
-            directors=ArrayAgg('persons__full_name', filter=Q(personfilmwork__role=RoleType.DIRECTOR), distinct=True),
-            writers=ArrayAgg('persons__full_name', filter=Q(personfilmwork__role=RoleType.WRITER), distinct=True),
+        queryset = self.model.objects.values(
+            *self.fields,
+            genres=F('document__genres'),
+            actors=F('document__actors_names'),
+            directors=F('document__directors_names'),
+            writers=F('document__writers_names'),
         )
         return queryset
 
+    def get(self, request: HttpRequest, *args, **kwargs) -> HttpResponse:
+        """Метод возвращает ответ из кэша или формирует и кэширует его.
+
+        Args:
+            request: запрос
+            args: аргументы URL
+            kwargs: аргументы URL
+
+        Returns:
+            HttpResponse: страница API в виде Json
+        """
+        if not is_cacheable(request):
+            return super().get(request, *args, **kwargs)
+        key = 'movies:api:v1:{0}'.format(hashlib.md5(request.get_full_path().encode('utf-8')).hexdigest())
+        generation = get_generation()
+        content = cache.get(key, version=generation)
+        if content is not None:
+            return HttpResponse(content, content_type='application/json')
+        response = super().get(request, *args, **kwargs)
+        if response.status_code == HTTPStatus.OK:
+            cache.set(key, response.content, settings.MOVIES_CACHE_TIMEOUT, version=generation)
+        return response
+
     def render_to_response(self, context: MovieContextType | MoviesContextType, **response_kwargs: Any) -> JsonResponse:
         """Метод отвечает за форматирование данных, которые вернутся при GET-запросе.
 
@@ -49,8 +157,32 @@ class MoviesApiMixin:  # noqa: WPS306
         return JsonResponse(context)
 
 
+@conditional
 class MoviesListApi(MoviesApiMixin, BaseListView):
-    """Класс для представления атрибутов полей модели Filmwork."""
+    """Класс для представления атрибутов полей модели Filmwork.
+
+    Режимы пагинации:
+        ?page=N - страницы по номеру, количество фильмов берётся из кэша;
+        ?cursor=<next> - страницы по курсору (title, id), первая страница - ?cursor=;
+            время ответа не зависит от глубины, prev не заполняется,
+            ?count=exact | estimate | none выбирает способ подсчёта count и total_pages.
+    """
+
+    paginate_by = settings.MOVIES_PAGE_SIZE
+    ordering = ('title', 'id')
+
+    def get_paginator(self, queryset: QuerySet, per_page: int, **kwargs) -> Paginator:
+        """Paginator без COUNT(*) по запросу с агрегатами.
+
+        Args:
+            queryset: Фильмы страницы.
+            per_page: Размер страницы.
+            kwargs: Аргументы Paginator.
+
+        Returns:
+            Paginator: Paginator с кэшированным количеством фильмов.
+        """
+        return CountedPaginator(queryset, per_page, known_count=get_exact_count(), **kwargs)
 
     def get_context_data(self, *, object_list=None, **kwargs) -> MoviesContextType:
         """Метод возвращает словарь с данными для формирования страницы.
@@ -58,9 +190,13 @@ class MoviesListApi(MoviesApiMixin, BaseListView):
         Returns:
             context: словарь с информацией о фильмах
         """
-        self.paginate_by = 50
         queryset = self.get_queryset()
-        paginator, page, queryset, is_paginated = self.paginate_queryset(queryset, self.paginate_by)
+        if 'cursor' in self.request.GET:
+            return self.get_cursor_context(queryset)
+        paginator, page, queryset, is_paginated = self.paginate_queryset(
+            queryset.order_by(*self.ordering),
+            self.paginate_by,
+        )
         context = {
             'count': paginator.count,
             'total_pages': paginator.num_pages,
@@ -70,7 +206,27 @@ class MoviesListApi(MoviesApiMixin, BaseListView):
         }
         return context
 
+    def get_cursor_context(self, queryset: QuerySet) -> MoviesContextType:
+        """Страница по курсору.
+
+        Args:
+            queryset: Фильмы.
+
+        Returns:
+            context: словарь с информацией о фильмах
+        """
+        results, next_cursor = paginate_by_cursor(queryset, self.request.GET['cursor'], self.paginate_by)
+        count = get_count(self.request.GET.get('count', 'exact'))
+        return {
+            'count': count,
+            'total_pages': get_total_pages(count, self.paginate_by),
+            'prev': None,
+            'next': next_cursor,
+            'results': results,
+        }
+
 
+@conditional
 class MoviesDetailApi(MoviesApiMixin, BaseDetailView):
     """Класс для представления атрибутов поля модели Filmwork."""
 
@@ -81,3 +237,86 @@ class MoviesDetailApi(MoviesApiMixin, BaseDetailView):
             context: словарь с информацией о фильме
         """
         return self.get_object()
+
+
+class MoviesExportApi(MoviesApiMixin, View):
+    """Выгрузка всего каталога одним ответом NDJSON: по строке JSON на фильм.
+
+    Фильмы читаются серверным курсором порциями по MOVIES_EXPORT_CHUNK_SIZE и сразу
+    отправляются клиенту, поэтому память процесса не зависит от размера каталога.
+    ?modified_since=<ISO 8601> - только фильмы, изменённые с этого времени, в порядке (modified, id),
+    и строки {"id": ..., "modified": ..., "deleted": true} для фильмов, удалённых с этого времени.
+    """
+
+    fields = (*MoviesApiMixin.fields, 'modified')
+
+    def get(self, request: HttpRequest, *args, **kwargs) -> StreamingHttpResponse:
+        """Метод возвращает поток фильмов в формате NDJSON.
+
+        Args:
+            request: запрос
+            args: аргументы URL
+            kwargs: аргументы URL
+
+        Returns:
+            StreamingHttpResponse: фильмы, по одному JSON на строку
+
+        Raises:
+            BadRequest: modified_since не является датой и временем ISO 8601
+        """
+        modified_since = None
+        if request.GET.get('modified_since'):
+            modified_since = parse_datetime(request.GET['modified_since'])
+            if modified_since is None:
+                raise BadRequest('modified_since must be an ISO 8601 datetime')
+        response = StreamingHttpResponse(self.iter_lines(modified_since), content_type='application/x-ndjson')
+        # Без буферизации в nginx строки доходят до клиента по мере чтения из базы.
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    def iter_lines(self, modified_since: Optional[datetime]) -> Iterator[str]:
+        """Генератор строк NDJSON.
+
+        Args:
+            modified_since: нижняя граница modified, None - весь каталог
+
+        Yields:
+            str: фильм в JSON с переводом строки
+        """
+        queryset = self.get_queryset().order_by('modified', 'id')
+        if modified_since is not None:
+            queryset = queryset.filter(modified__gte=modified_since)
+        for movie in queryset.iterator(chunk_size=settings.MOVIES_EXPORT_CHUNK_SIZE):
+            yield json.dumps(movie, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+        if modified_since is not None:
+            yield from self.iter_deleted(modified_since)
+
+    def iter_deleted(self, modified_since: datetime) -> Iterator[str]:
+        """Генератор строк NDJSON об удалённых фильмах из журнала content.film_work_deleted.
+
+        Журнал читается страницами по MOVIES_EXPORT_CHUNK_SIZE записей с keyset-пагинацией по (modified, id):
+        курсор psycopg2 без имени загрузил бы в память весь результат запроса.
+
+        Args:
+            modified_since: нижняя граница времени удаления
+
+        Yields:
+            str: id и время удаления фильма в JSON с переводом строки
+        """
+        position = (modified_since, MIN_UUID)
+        comparison = '>='
+        while True:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    DELETED_PAGE_SQL.format(comparison=comparison),
+                    [*position, settings.MOVIES_EXPORT_CHUNK_SIZE],
+                )
+                rows = cursor.fetchall()
+            for doc_id, modified, restored in rows:
+                if not restored:
+                    line = {'id': doc_id, 'modified': modified, 'deleted': True}
+                    yield json.dumps(line, cls=DjangoJSONEncoder) + '\n'
+            if len(rows) < settings.MOVIES_EXPORT_CHUNK_SIZE:
+                return
+            position = rows[-1][:2]
+            comparison = '>'
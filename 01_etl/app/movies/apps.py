@@ -8,3 +8,8 @@ class MoviesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'movies'
     verbose_name = _('movies')
+
+    def ready(self) -> None:
+        """Подключение сигналов сброса кэша API."""
+        from .signals import connect_signals  # noqa: WPS433
+        connect_signals()
@@ -0,0 +1,51 @@
+"""Поколение каталога фильмов для версионирования кэша.
+
+Поколение хранится в кэше default. Общим для всех процессов uwsgi оно будет только в Redis
+(CACHE_REDIS_URL): с LocMemCache у каждого процесса своё поколение, и изменение каталога
+сбрасывает кэш только процесса, который его выполнил; остальные отдают прежние ответы
+до истечения MOVIES_CACHE_TIMEOUT.
+"""
+
+import time
+from datetime import datetime, timezone
+
+from django.core.cache import cache
+
+GENERATION_KEY = 'movies:generation'
+MODIFIED_KEY = 'movies:modified'
+
+
+def get_generation() -> int:
+    """Текущее поколение каталога; используется как version ключей кэша.
+
+    Returns:
+        int: Поколение каталога.
+    """
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        cache.add(MODIFIED_KEY, time.time(), timeout=None)
+        cache.add(GENERATION_KEY, 1, timeout=None)
+        generation = cache.get(GENERATION_KEY, 1)
+    return generation
+
+
+def get_last_modified() -> datetime:
+    """Время последнего изменения каталога.
+
+    Returns:
+        datetime: Время изменения; время первого обращения, если изменений ещё не было.
+    """
+    modified = cache.get(MODIFIED_KEY)
+    if modified is None:
+        modified = time.time()
+        cache.add(MODIFIED_KEY, modified, timeout=None)
+    return datetime.fromtimestamp(modified, tz=timezone.utc)
+
+
+def bump_generation() -> None:
+    """Новое поколение каталога: прежние версии ключей кэша больше не читаются."""
+    cache.set(MODIFIED_KEY, time.time(), timeout=None)
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.add(GENERATION_KEY, 1, timeout=None)
@@ -0,0 +1,55 @@
+from django.db import migrations
+
+ETL_TABLES = ('film_work', 'person', 'genre', 'person_film_work', 'genre_film_work')
+
+NOTIFY_FUNCTION_SQL = """
+CREATE OR REPLACE FUNCTION content.notify_etl_changes() RETURNS trigger AS $$
+BEGIN
+    IF TG_TABLE_NAME IN ('person_film_work', 'genre_film_work') THEN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            PERFORM pg_notify(
+                'etl_changes',
+                json_build_object('table', TG_TABLE_NAME, 'film_work_id', OLD.film_work_id)::text
+            );
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            PERFORM pg_notify(
+                'etl_changes',
+                json_build_object('table', TG_TABLE_NAME, 'film_work_id', NEW.film_work_id)::text
+            );
+        END IF;
+    ELSE
+        PERFORM pg_notify('etl_changes', json_build_object('table', TG_TABLE_NAME)::text);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+CREATE_TRIGGER_SQL = """
+CREATE TRIGGER {table}_etl_notify
+AFTER INSERT OR UPDATE OR DELETE ON content.{table}
+FOR EACH ROW EXECUTE FUNCTION content.notify_etl_changes();
+"""
+
+DROP_TRIGGER_SQL = 'DROP TRIGGER IF EXISTS {table}_etl_notify ON content.{table};'
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0002_modified_id_indexes'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=NOTIFY_FUNCTION_SQL,
+            reverse_sql='DROP FUNCTION IF EXISTS content.notify_etl_changes();',
+        ),
+    ] + [
+        migrations.RunSQL(
+            sql=CREATE_TRIGGER_SQL.format(table=table),
+            reverse_sql=DROP_TRIGGER_SQL.format(table=table),
+        )
+        for table in ETL_TABLES
+    ]
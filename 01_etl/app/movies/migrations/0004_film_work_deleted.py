@@ -0,0 +1,48 @@
+from django.db import migrations
+
+CREATE_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS content.film_work_deleted (
+    id uuid PRIMARY KEY,
+    modified timestamp with time zone NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS fw_deleted_modified_id_idx ON content.film_work_deleted(modified, id);
+"""
+
+LOG_FUNCTION_SQL = """
+CREATE OR REPLACE FUNCTION content.log_film_work_deleted() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO content.film_work_deleted (id, modified)
+    VALUES (OLD.id, now())
+    ON CONFLICT (id) DO UPDATE SET modified = EXCLUDED.modified;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+CREATE_TRIGGER_SQL = """
+CREATE TRIGGER film_work_log_deleted
+AFTER DELETE ON content.film_work
+FOR EACH ROW EXECUTE FUNCTION content.log_film_work_deleted();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0003_etl_notify_triggers'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=CREATE_TABLE_SQL,
+            reverse_sql='DROP TABLE IF EXISTS content.film_work_deleted;',
+        ),
+        migrations.RunSQL(
+            sql=LOG_FUNCTION_SQL,
+            reverse_sql='DROP FUNCTION IF EXISTS content.log_film_work_deleted();',
+        ),
+        migrations.RunSQL(
+            sql=CREATE_TRIGGER_SQL,
+            reverse_sql='DROP TRIGGER IF EXISTS film_work_log_deleted ON content.film_work;',
+        ),
+    ]
@@ -0,0 +1,19 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0004_film_work_deleted'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='filmwork',
+            name='fw_title_idx',
+        ),
+        migrations.AddIndex(
+            model_name='filmwork',
+            index=models.Index(fields=['title', 'id'], name='fw_title_id_idx'),
+        ),
+    ]
@@ -0,0 +1,251 @@
+import django.contrib.postgres.fields
+import django.db.models.deletion
+from django.db import migrations, models
+
+CREATE_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS content.film_work_document (
+    id uuid PRIMARY KEY REFERENCES content.film_work (id) ON DELETE CASCADE,
+    genres TEXT[] NOT NULL DEFAULT '{}',
+    director TEXT NOT NULL DEFAULT '',
+    directors_names TEXT[] NOT NULL DEFAULT '{}',
+    actors_names TEXT[] NOT NULL DEFAULT '{}',
+    writers_names TEXT[] NOT NULL DEFAULT '{}',
+    actors jsonb NOT NULL DEFAULT '[]',
+    writers jsonb NOT NULL DEFAULT '[]',
+    modified timestamp with time zone NOT NULL DEFAULT now()
+);
+"""
+
+# Пересборка жанров и участников фильмов. Агрегаты совпадают с прежним SQL_QUERY ETL,
+# но жанры и участники собираются отдельными подзапросами, без произведения person x genre.
+REFRESH_FUNCTION_SQL = """
+CREATE OR REPLACE FUNCTION content.refresh_film_work_document(film_work_ids uuid[]) RETURNS void AS $$
+BEGIN
+    INSERT INTO content.film_work_document AS doc (
+        id, genres, director, directors_names, actors_names, writers_names, actors, writers, modified
+    )
+    SELECT
+        fw.id,
+        genres_agg.genres,
+        persons_agg.director,
+        persons_agg.directors_names,
+        persons_agg.actors_names,
+        persons_agg.writers_names,
+        persons_agg.actors,
+        persons_agg.writers,
+        now()
+    FROM content.film_work fw
+    CROSS JOIN LATERAL (
+        SELECT COALESCE(array_agg(DISTINCT g.name), '{}') AS genres
+        FROM content.genre_film_work gfw
+        JOIN content.genre g ON g.id = gfw.genre_id
+        WHERE gfw.film_work_id = fw.id
+    ) genres_agg
+    CROSS JOIN LATERAL (
+        SELECT
+            COALESCE(string_agg(DISTINCT p.full_name, '') FILTER (WHERE pfw.role = 'director'), '') AS director,
+            COALESCE(array_agg(DISTINCT p.full_name) FILTER (WHERE pfw.role = 'director'), '{}') AS directors_names,
+            COALESCE(array_agg(DISTINCT p.full_name) FILTER (WHERE pfw.role = 'actor'), '{}') AS actors_names,
+            COALESCE(array_agg(DISTINCT p.full_name) FILTER (WHERE pfw.role = 'writer'), '{}') AS writers_names,
+            COALESCE(
+                jsonb_agg(DISTINCT jsonb_build_object('id', p.id, 'name', p.full_name))
+                FILTER (WHERE pfw.role = 'actor'),
+                '[]'
+            ) AS actors,
+            COALESCE(
+                jsonb_agg(DISTINCT jsonb_build_object('id', p.id, 'name', p.full_name))
+                FILTER (WHERE pfw.role = 'writer'),
+                '[]'
+            ) AS writers
+        FROM content.person_film_work pfw
+        JOIN content.person p ON p.id = pfw.person_id
+        WHERE pfw.film_work_id = fw.id
+    ) persons_agg
+    WHERE fw.id = ANY(film_work_ids)
+    ON CONFLICT (id) DO UPDATE SET
+        genres = EXCLUDED.genres,
+        director = EXCLUDED.director,
+        directors_names = EXCLUDED.directors_names,
+        actors_names = EXCLUDED.actors_names,
+        writers_names = EXCLUDED.writers_names,
+        actors = EXCLUDED.actors,
+        writers = EXCLUDED.writers,
+        modified = EXCLUDED.modified;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+# Триггеры уровня оператора с таблицами переходов: одна пересборка на оператор, а не на строку.
+LINKS_FUNCTION_SQL = """
+CREATE OR REPLACE FUNCTION content.film_work_document_links_changed() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM content.refresh_film_work_document(ARRAY(SELECT DISTINCT film_work_id FROM new_rows));
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM content.refresh_film_work_document(ARRAY(SELECT DISTINCT film_work_id FROM old_rows));
+    ELSE
+        PERFORM content.refresh_film_work_document(ARRAY(
+            SELECT film_work_id FROM new_rows UNION SELECT film_work_id FROM old_rows
+        ));
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+NAMES_FUNCTION_SQL = """
+CREATE OR REPLACE FUNCTION content.film_work_document_names_changed() RETURNS trigger AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'person' THEN
+        PERFORM content.refresh_film_work_document(ARRAY(
+            SELECT DISTINCT pfw.film_work_id
+            FROM new_rows n
+            JOIN old_rows o ON o.id = n.id
+            JOIN content.person_film_work pfw ON pfw.person_id = n.id
+            WHERE n.full_name IS DISTINCT FROM o.full_name
+        ));
+    ELSE
+        PERFORM content.refresh_film_work_document(ARRAY(
+            SELECT DISTINCT gfw.film_work_id
+            FROM new_rows n
+            JOIN old_rows o ON o.id = n.id
+            JOIN content.genre_film_work gfw ON gfw.genre_id = n.id
+            WHERE n.name IS DISTINCT FROM o.name
+        ));
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+CREATED_FUNCTION_SQL = """
+CREATE OR REPLACE FUNCTION content.film_work_document_created() RETURNS trigger AS $$
+BEGIN
+    PERFORM content.refresh_film_work_document(ARRAY(SELECT id FROM new_rows));
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+LINK_TABLES = ('person_film_work', 'genre_film_work')
+NAME_TABLES = ('person', 'genre')
+
+LINK_TRIGGERS_SQL = """
+CREATE TRIGGER {table}_document_insert
+AFTER INSERT ON content.{table}
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION content.film_work_document_links_changed();
+
+CREATE TRIGGER {table}_document_update
+AFTER UPDATE ON content.{table}
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION content.film_work_document_links_changed();
+
+CREATE TRIGGER {table}_document_delete
+AFTER DELETE ON content.{table}
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION content.film_work_document_links_changed();
+"""
+
+DROP_LINK_TRIGGERS_SQL = """
+DROP TRIGGER IF EXISTS {table}_document_insert ON content.{table};
+DROP TRIGGER IF EXISTS {table}_document_update ON content.{table};
+DROP TRIGGER IF EXISTS {table}_document_delete ON content.{table};
+"""
+
+NAME_TRIGGER_SQL = """
+CREATE TRIGGER {table}_document_update
+AFTER UPDATE ON content.{table}
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION content.film_work_document_names_changed();
+"""
+
+DROP_NAME_TRIGGER_SQL = 'DROP TRIGGER IF EXISTS {table}_document_update ON content.{table};'
+
+CREATED_TRIGGER_SQL = """
+CREATE TRIGGER film_work_document_insert
+AFTER INSERT ON content.film_work
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION content.film_work_document_created();
+"""
+
+BACKFILL_SQL = 'SELECT content.refresh_film_work_document(ARRAY(SELECT id FROM content.film_work));'
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0005_film_work_title_id_index'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=CREATE_TABLE_SQL,
+            reverse_sql='DROP TABLE IF EXISTS content.film_work_document;',
+        ),
+        migrations.RunSQL(
+            sql=REFRESH_FUNCTION_SQL,
+            reverse_sql='DROP FUNCTION IF EXISTS content.refresh_film_work_document(uuid[]);',
+        ),
+        migrations.RunSQL(
+            sql=LINKS_FUNCTION_SQL,
+            reverse_sql='DROP FUNCTION IF EXISTS content.film_work_document_links_changed();',
+        ),
+        migrations.RunSQL(
+            sql=NAMES_FUNCTION_SQL,
+            reverse_sql='DROP FUNCTION IF EXISTS content.film_work_document_names_changed();',
+        ),
+        migrations.RunSQL(
+            sql=CREATED_FUNCTION_SQL,
+            reverse_sql='DROP FUNCTION IF EXISTS content.film_work_document_created();',
+        ),
+    ] + [
+        migrations.RunSQL(
+            sql=LINK_TRIGGERS_SQL.format(table=table),
+            reverse_sql=DROP_LINK_TRIGGERS_SQL.format(table=table),
+        )
+        for table in LINK_TABLES
+    ] + [
+        migrations.RunSQL(
+            sql=NAME_TRIGGER_SQL.format(table=table),
+            reverse_sql=DROP_NAME_TRIGGER_SQL.format(table=table),
+        )
+        for table in NAME_TABLES
+    ] + [
+        migrations.RunSQL(
+            sql=CREATED_TRIGGER_SQL,
+            reverse_sql='DROP TRIGGER IF EXISTS film_work_document_insert ON content.film_work;',
+        ),
+        migrations.RunSQL(
+            sql=BACKFILL_SQL,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.CreateModel(
+            name='FilmworkDocument',
+            fields=[
+                ('film_work', models.OneToOneField(
+                    db_column='id',
+                    on_delete=django.db.models.deletion.DO_NOTHING,
+                    primary_key=True,
+                    related_name='document',
+                    serialize=False,
+                    to='movies.filmwork',
+                )),
+                ('genres', django.contrib.postgres.fields.ArrayField(base_field=models.TextField(), size=None)),
+                ('director', models.TextField()),
+                ('directors_names', django.contrib.postgres.fields.ArrayField(
+                    base_field=models.TextField(),
+                    size=None,
+                )),
+                ('actors_names', django.contrib.postgres.fields.ArrayField(base_field=models.TextField(), size=None)),
+                ('writers_names', django.contrib.postgres.fields.ArrayField(base_field=models.TextField(), size=None)),
+                ('actors', models.JSONField()),
+                ('writers', models.JSONField()),
+                ('modified', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'content"."film_work_document',
+                'managed': False,
+            },
+        ),
+    ]
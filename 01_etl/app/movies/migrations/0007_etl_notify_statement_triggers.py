@@ -0,0 +1,145 @@
+from django.db import migrations
+
+NAME_TABLES = ('film_work', 'person', 'genre')
+LINK_TABLES = ('person_film_work', 'genre_film_work')
+
+# Строчные триггеры миграции 0003: одно уведомление на строку, тысячи уведомлений при массовой загрузке.
+ROW_NOTIFY_FUNCTION_SQL = """
+CREATE OR REPLACE FUNCTION content.notify_etl_changes() RETURNS trigger AS $$
+BEGIN
+    IF TG_TABLE_NAME IN ('person_film_work', 'genre_film_work') THEN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            PERFORM pg_notify(
+                'etl_changes',
+                json_build_object('table', TG_TABLE_NAME, 'film_work_id', OLD.film_work_id)::text
+            );
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            PERFORM pg_notify(
+                'etl_changes',
+                json_build_object('table', TG_TABLE_NAME, 'film_work_id', NEW.film_work_id)::text
+            );
+        END IF;
+    ELSE
+        PERFORM pg_notify('etl_changes', json_build_object('table', TG_TABLE_NAME)::text);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+CREATE_ROW_TRIGGER_SQL = """
+CREATE TRIGGER {table}_etl_notify
+AFTER INSERT OR UPDATE OR DELETE ON content.{table}
+FOR EACH ROW EXECUTE FUNCTION content.notify_etl_changes();
+"""
+
+DROP_ROW_TRIGGER_SQL = 'DROP TRIGGER IF EXISTS {table}_etl_notify ON content.{table};'
+
+# Одно уведомление на оператор: ETL перечитывает изменения таблицы по modified.
+NOTIFY_FUNCTION_SQL = """
+CREATE OR REPLACE FUNCTION content.notify_etl_changes() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('etl_changes', json_build_object('table', TG_TABLE_NAME)::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+# Изменения связей не видны по modified, поэтому уведомление передаёт film_work_ids из таблиц переходов:
+# по 100 фильмов в уведомлении, чтобы не превысить предел размера payload (8000 байт).
+LINK_NOTIFY_FUNCTION_SQL = """
+CREATE OR REPLACE FUNCTION content.notify_etl_link_changes() RETURNS trigger AS $$
+DECLARE
+    film_work_ids text[];
+    chunk_start integer := 1;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        film_work_ids := ARRAY(SELECT DISTINCT film_work_id::text FROM new_rows);
+    ELSIF TG_OP = 'DELETE' THEN
+        film_work_ids := ARRAY(SELECT DISTINCT film_work_id::text FROM old_rows);
+    ELSE
+        film_work_ids := ARRAY(
+            SELECT film_work_id::text FROM new_rows UNION SELECT film_work_id::text FROM old_rows
+        );
+    END IF;
+    WHILE chunk_start <= COALESCE(array_length(film_work_ids, 1), 0) LOOP
+        PERFORM pg_notify(
+            'etl_changes',
+            json_build_object(
+                'table', TG_TABLE_NAME,
+                'film_work_ids', film_work_ids[chunk_start:chunk_start + 99]
+            )::text
+        );
+        chunk_start := chunk_start + 100;
+    END LOOP;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+NAME_TRIGGER_SQL = """
+CREATE TRIGGER {table}_etl_notify
+AFTER INSERT OR UPDATE OR DELETE ON content.{table}
+FOR EACH STATEMENT EXECUTE FUNCTION content.notify_etl_changes();
+"""
+
+# Триггер с таблицами переходов задаётся для одного события.
+LINK_TRIGGERS_SQL = """
+CREATE TRIGGER {table}_etl_notify_insert
+AFTER INSERT ON content.{table}
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION content.notify_etl_link_changes();
+
+CREATE TRIGGER {table}_etl_notify_update
+AFTER UPDATE ON content.{table}
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION content.notify_etl_link_changes();
+
+CREATE TRIGGER {table}_etl_notify_delete
+AFTER DELETE ON content.{table}
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION content.notify_etl_link_changes();
+"""
+
+DROP_LINK_TRIGGERS_SQL = """
+DROP TRIGGER IF EXISTS {table}_etl_notify_insert ON content.{table};
+DROP TRIGGER IF EXISTS {table}_etl_notify_update ON content.{table};
+DROP TRIGGER IF EXISTS {table}_etl_notify_delete ON content.{table};
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0006_film_work_document'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=DROP_ROW_TRIGGER_SQL.format(table=table),
+            reverse_sql=CREATE_ROW_TRIGGER_SQL.format(table=table),
+        )
+        for table in (*NAME_TABLES, *LINK_TABLES)
+    ] + [
+        migrations.RunSQL(
+            sql=NOTIFY_FUNCTION_SQL,
+            reverse_sql=ROW_NOTIFY_FUNCTION_SQL,
+        ),
+        migrations.RunSQL(
+            sql=LINK_NOTIFY_FUNCTION_SQL,
+            reverse_sql='DROP FUNCTION IF EXISTS content.notify_etl_link_changes();',
+        ),
+    ] + [
+        migrations.RunSQL(
+            sql=NAME_TRIGGER_SQL.format(table=table),
+            reverse_sql=DROP_ROW_TRIGGER_SQL.format(table=table),
+        )
+        for table in NAME_TABLES
+    ] + [
+        migrations.RunSQL(
+            sql=LINK_TRIGGERS_SQL.format(table=table),
+            reverse_sql=DROP_LINK_TRIGGERS_SQL.format(table=table),
+        )
+        for table in LINK_TABLES
+    ]
@@ -1,5 +1,6 @@
 import uuid
 
+from django.contrib.postgres.fields import ArrayField
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
 from django.utils.translation import gettext_lazy as _
@@ -42,6 +43,10 @@ class Genre(UUIDMixin, TimeStampedMixin):
                 fields=['name'],
                 name='genre_name_idx',
             ),
+            models.Index(
+                fields=['modified', 'id'],
+                name='genre_modified_id_idx',
+            ),
         ]
 
 
@@ -62,6 +67,10 @@ class Person(UUIDMixin, TimeStampedMixin):
                 fields=['full_name'],
                 name='p_full_name_idx',
             ),
+            models.Index(
+                fields=['modified', 'id'],
+                name='p_modified_id_idx',
+            ),
         ]
 
 
@@ -97,11 +106,15 @@ class Filmwork(UUIDMixin, TimeStampedMixin):
         verbose_name = _('film_work')
         verbose_name_plural = _('film_works')
         indexes = [
-            models.Index(fields=['title'], name='fw_title_idx'),
+            models.Index(fields=['title', 'id'], name='fw_title_id_idx'),
             models.Index(
                 fields=['creation_date', 'title'],
                 name='fw_creation_date_title_idx',
             ),
+            models.Index(
+                fields=['modified', 'id'],
+                name='fw_modified_id_idx',
+            ),
         ]
         constraints = [
             models.UniqueConstraint(
@@ -156,9 +169,43 @@ class PersonFilmwork(UUIDMixin):
         db_table = 'content"."person_film_work'
         verbose_name = _('person')
         verbose_name_plural = _('persons')
+        indexes = [
+            models.Index(
+                fields=['person_id', 'film_work_id'],
+                name='p_fw_person_id_fw_id_idx',
+            ),
+        ]
         constraints = [
             models.UniqueConstraint(
                 fields=['film_work_id', 'person_id', 'role'],
                 name='p_fw_person_id_idx',
             ),
         ]
+
+
+class FilmworkDocument(models.Model):
+    """Жанры и участники фильма, собранные триггерами базы данных (миграция 0006).
+
+    Таблица обновляется триггерами на связях фильма, жанрах и участниках, поэтому модель
+    только читает её: API и ETL получают готовые массивы одним запросом по id фильма.
+    """
+
+    film_work = models.OneToOneField(
+        Filmwork,
+        primary_key=True,
+        db_column='id',
+        related_name='document',
+        on_delete=models.DO_NOTHING,
+    )
+    genres = ArrayField(models.TextField())
+    director = models.TextField()
+    directors_names = ArrayField(models.TextField())
+    actors_names = ArrayField(models.TextField())
+    writers_names = ArrayField(models.TextField())
+    actors = models.JSONField()
+    writers = models.JSONField()
+    modified = models.DateTimeField()
+
+    class Meta:
+        managed = False
+        db_table = 'content"."film_work_document'
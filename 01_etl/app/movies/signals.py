@@ -0,0 +1,49 @@
+"""Сброс кэша API при изменении каталога.
+
+Поколение каталога меняется после фиксации транзакции (transaction.on_commit): иначе
+параллельный запрос успел бы прочитать прежние строки и закэшировать их под новым поколением.
+"""
+
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+from .cache import bump_generation
+from .models import Filmwork, Genre, GenreFilmwork, Person, PersonFilmwork
+
+CATALOGUE_MODELS = (Filmwork, Person, Genre, GenreFilmwork, PersonFilmwork)
+M2M_ACTIONS = frozenset(('post_add', 'post_remove', 'post_clear'))
+
+
+def catalogue_saved(sender, **kwargs) -> None:
+    """Сохранение | удаление записи каталога.
+
+    Args:
+        sender: Модель записи.
+        kwargs: Аргументы сигнала.
+    """
+    transaction.on_commit(bump_generation)
+
+
+def catalogue_m2m_changed(sender, action: str, **kwargs) -> None:
+    """Изменение жанров | участников фильма через ManyToManyField.
+
+    Args:
+        sender: Модель связи.
+        action: Этап изменения.
+        kwargs: Аргументы сигнала.
+    """
+    if action in M2M_ACTIONS:
+        transaction.on_commit(bump_generation)
+
+
+def connect_signals() -> None:
+    """Подключение обработчиков.
+
+    QuerySet.update() и изменения в обход ORM сигналов не посылают:
+    такие ответы устаревают не дольше, чем на MOVIES_CACHE_TIMEOUT.
+    """
+    for model in CATALOGUE_MODELS:
+        post_save.connect(catalogue_saved, sender=model, dispatch_uid=f'movies_cache_save_{model.__name__}')
+        post_delete.connect(catalogue_saved, sender=model, dispatch_uid=f'movies_cache_delete_{model.__name__}')
+    for through in (Filmwork.genres.through, Filmwork.persons.through):
+        m2m_changed.connect(catalogue_m2m_changed, sender=through, dispatch_uid=f'movies_cache_m2m_{through.__name__}')
@@ -0,0 +1,336 @@
+import asyncio
+import itertools
+import logging
+import time
+from typing import Iterator
+
+from elasticsearch import AsyncElasticsearch, TransportError
+
+from components import log_config, metrics, models
+from components.dead_letter import DeadLetterQueue
+from components.settings import Settings, get_settings
+from components.state import State
+from components.utilities import backoff
+from elastic_loader import iter_chunks, split_bulk_response
+from etl_service import ETLService
+
+log_config.get_log()
+
+# Пачка, отметки таблиц и вид операций bulk: 'index' | 'update' | 'delete'.
+PGBatch = tuple[list, dict[str, models.Watermark], str]
+
+
+class AsyncESLoader:
+    def __init__(self, dsl: str, index_name: str):
+        """
+        Args:
+            dsl: Клиент для связи с сервером Elasticsearch.
+            index_name: Индекс.
+        """
+        self.dsl = dsl
+        self.index_name = index_name
+        self.max_docs = get_settings().bulk_max_docs
+        self.max_bytes = get_settings().bulk_max_bytes
+        self.item_retries = get_settings().bulk_item_retries
+        self.dead_letter = DeadLetterQueue(get_settings().dead_letter_file)
+        self.connection = AsyncElasticsearch(self.dsl)
+
+    @backoff(logger=log_config.get_log, dependency='elasticsearch')
+    async def check_connection(self) -> None:
+        """Проверка связи с сервером Elasticsearch."""
+        if not await self.connection.ping():
+            logging.error('Нет связи с сервером Elasticsearch')
+            raise TransportError('Нет связи с сервером Elasticsearch')
+
+    @backoff(logger=log_config.get_log, dependency='elasticsearch')
+    async def post_bulk(self, chunk: list[bytes]) -> dict:
+        """
+        Bulk-запрос в Elasticsearch; при ошибке соединения повторяется тот же набор операций.
+
+        Args:
+            chunk: Список операций bulk.
+
+        Returns:
+            response: Ответ Elasticsearch.
+        """
+        return await self.connection.bulk(operations=b''.join(chunk), index=self.index_name)
+
+    async def send_chunk(self, chunk: list[bytes]) -> list[str]:
+        """
+        Отправка одного чанка bulk с повтором только временно не принятых операций.
+
+        Args:
+            chunk: Список операций bulk.
+
+        Returns:
+            rejected_ids: Идентификаторы документов, сохранённых в очередь недоставленных.
+
+        Raises:
+            RuntimeError: Временные ошибки не устранились за ES_BULK_ITEM_RETRIES повторов.
+        """
+        started = time.perf_counter()
+        pending = chunk
+        rejected_ids = []
+        for attempt in range(self.item_retries + 1):
+            if attempt:
+                logging.warning(f'Повтор {len(pending)} операций bulk, попытка {attempt}')
+                await asyncio.sleep(min(0.5 * 2 ** attempt, 30))
+            pending, rejected = split_bulk_response(pending, await self.post_bulk(pending))
+            for operation, item in rejected:
+                await asyncio.to_thread(self.dead_letter.put, operation, item)
+                rejected_ids.append(item.get('_id'))
+            if not pending:
+                break
+        else:
+            raise RuntimeError(f'Elasticsearch не принял {len(pending)} операций bulk')
+        metrics.BULK_LATENCY.observe(time.perf_counter() - started)
+        metrics.BULK_DOCS.inc(len(chunk))
+        metrics.BULK_BYTES.inc(sum(len(operation) for operation in chunk))
+        metrics.BULK_REJECTED.inc(len(rejected_ids))
+        return rejected_ids
+
+    async def push_bulk(self, bulk: list[bytes]) -> set[str]:
+        """
+        Отправка пачки данных в Elasticsearch чанками по ES_BULK_MAX_DOCS документов и ES_BULK_MAX_BYTES байт.
+
+        Args:
+            bulk: Список операций bulk в формате NDJSON.
+
+        Returns:
+            rejected_ids: Идентификаторы документов, сохранённых в очередь недоставленных.
+        """
+        rejected_ids = set()
+        for chunk in iter_chunks(bulk, self.max_docs, self.max_bytes):
+            rejected_ids.update(await self.send_chunk(chunk))
+        return rejected_ids
+
+    async def close(self) -> None:
+        """Закрытие соединения с Elasticsearch."""
+        await self.connection.close()
+
+
+class WatermarkCommitter:
+    """Сохранение отметок таблиц в порядке извлечения пачек.
+
+    Пачки загружаются в Elasticsearch параллельно и могут завершаться в любом порядке,
+    а отметка сохраняется, только когда загружены все предыдущие пачки.
+    """
+
+    def __init__(self, state_maneger: State) -> None:
+        """
+        Args:
+            state_maneger: Объект класса State для хранения состояний.
+        """
+        self.state_maneger = state_maneger
+        self.next_seq = 0
+        self.done = {}
+        # Продвинулась ли отметка хотя бы одной таблицы.
+        self.advanced = False
+
+    def complete(self, seq: int, watermarks: dict[str, models.Watermark]) -> None:
+        """Отметить пачку загруженной и сохранить накопившиеся отметки.
+
+        Args:
+            seq: Порядковый номер пачки.
+            watermarks: Отметки таблиц пачки.
+        """
+        self.done[seq] = watermarks
+        ready = {}
+        while self.next_seq in self.done:
+            ready.update(self.done.pop(self.next_seq))
+            self.next_seq += 1
+        if ready:
+            self.advanced |= self.state_maneger.advances(ready)
+            self.state_maneger.commit(ready)
+            for table, watermark in ready.items():
+                logging.info(f'Последнее обновление данных ({table}): {watermark.modified}, {watermark.id}')
+
+
+class AsyncPipeline:
+    """Конвейер extract -> transform -> load с ограниченными очередями между этапами.
+
+    Этапы работают одновременно: пока Elasticsearch индексирует пачку,
+    из PostgreSQL уже читается и преобразуется следующая.
+    """
+
+    def __init__(self, service: ETLService, loader: AsyncESLoader, queue_size: int, concurrency: int) -> None:
+        """
+        Args:
+            service: Сервис ETL с extractor, transformer и state_maneger.
+            loader: Асинхронный загрузчик в Elasticsearch.
+            queue_size: Максимальное количество пачек в очереди между этапами.
+            concurrency: Количество одновременных bulk-запросов.
+        """
+        self.service = service
+        self.loader = loader
+        self.queue_size = queue_size
+        self.concurrency = concurrency
+
+    async def extract(self, source: Iterator[PGBatch], queue_out: asyncio.Queue) -> None:
+        """Чтение пачек из PostgreSQL в отдельном потоке.
+
+        Args:
+            source: Генератор пачек PostgresExtractor.
+            queue_out: Очередь для этапа transform.
+        """
+        seq = 0
+        histogram = metrics.STAGE_SECONDS.labels('extract')
+        while not self.service.stop_event.is_set():
+            started = time.perf_counter()
+            item = await asyncio.to_thread(next, source, None)
+            if item is None:
+                break
+            histogram.observe(time.perf_counter() - started)
+            await queue_out.put((seq, *item))
+            seq += 1
+        await queue_out.put(None)
+
+    async def transform(self, queue_in: asyncio.Queue, queue_out: asyncio.Queue) -> None:
+        """Сборка bulk в отдельном потоке.
+
+        Args:
+            queue_in: Очередь пачек из PostgreSQL.
+            queue_out: Очередь для этапа load.
+        """
+        histogram = metrics.STAGE_SECONDS.labels('transform')
+        while (item := await queue_in.get()) is not None:
+            seq, pg_data, watermarks, kind = item
+            started = time.perf_counter()
+            transformer = self.service.transformer
+            if kind == 'index':
+                bulk, hashes = await asyncio.to_thread(transformer.compile_changed, pg_data)
+            else:
+                compile_bulk = transformer.compile_updates if kind == 'update' else transformer.compile_deletes
+                bulk = await asyncio.to_thread(compile_bulk, pg_data)
+                hashes = {}
+            histogram.observe(time.perf_counter() - started)
+            await queue_out.put((seq, bulk, watermarks, hashes, kind))
+        await queue_out.put(None)
+
+    async def load(self, queue_in: asyncio.Queue) -> tuple[int, bool]:
+        """Отправка bulk в Elasticsearch, не более concurrency запросов одновременно.
+
+        Параллельно отправляются только пачки 'index'. Пачка 'update' | 'delete' ждёт загрузки всех
+        предыдущих пачек, а следующая пачка - её загрузки: иначе удаление или частичное обновление фильма
+        могло бы дойти до Elasticsearch раньше более старого полного документа того же фильма.
+
+        Args:
+            queue_in: Очередь готовых bulk.
+
+        Returns:
+            count: Количество обработанных пачек.
+            advanced: Продвинулась ли отметка хотя бы одной таблицы.
+        """
+        committer = WatermarkCommitter(self.service.state_maneger)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        tasks = set()
+
+        async def push(
+            seq: int,
+            bulk: list[bytes],
+            watermarks: dict[str, models.Watermark],
+            hashes: dict[str, str],
+        ) -> None:
+            started = time.perf_counter()
+            try:
+                if bulk:
+                    rejected_ids = await self.loader.push_bulk(bulk)
+                    if hashes and self.service.hash_index is not None:
+                        await asyncio.to_thread(self.service.hash_index.update, {
+                            doc_id: digest for doc_id, digest in hashes.items() if doc_id not in rejected_ids
+                        })
+                committer.complete(seq, watermarks)
+                metrics.STAGE_SECONDS.labels('load').observe(time.perf_counter() - started)
+            finally:
+                semaphore.release()
+
+        count = 0
+        last_kind = None
+        while (item := await queue_in.get()) is not None:
+            *batch, kind = item
+            if tasks and (kind != 'index' or last_kind != 'index'):
+                await asyncio.gather(*tasks)
+            last_kind = kind
+            await semaphore.acquire()
+            task = asyncio.create_task(push(*batch))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            count += 1
+        if tasks:
+            await asyncio.gather(*tasks)
+        return count, committer.advanced
+
+    async def run(self, source: Iterator[PGBatch]) -> bool:
+        """Запуск всех этапов конвейера.
+
+        Args:
+            source: Генератор пачек PostgresExtractor.
+
+        Returns:
+            bool: Продвинулась ли отметка хотя бы одной таблицы.
+        """
+        pg_queue = asyncio.Queue(maxsize=self.queue_size)
+        bulk_queue = asyncio.Queue(maxsize=self.queue_size)
+        await self.loader.check_connection()
+        tasks = [
+            asyncio.create_task(self.extract(source, pg_queue)),
+            asyncio.create_task(self.transform(pg_queue, bulk_queue)),
+            asyncio.create_task(self.load(bulk_queue)),
+        ]
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        for task in pending:
+            task.cancel()
+        for task in done:
+            if task.exception() is not None:
+                raise task.exception()
+        count, advanced = tasks[-1].result()
+        if count:
+            logging.info(f'Данные успешно обновлены, пачек: {count}')
+        return advanced
+
+
+class AsyncETLService(ETLService):
+    """Сервис ETL, в котором extract, transform и load выполняются конвейером asyncio."""
+
+    def __init__(self, settings: Settings) -> None:
+        """
+        Args:
+            settings: Настройки ETL.
+        """
+        super().__init__(settings)
+        self.event_loop = asyncio.new_event_loop()
+        self.pipeline = AsyncPipeline(
+            service=self,
+            loader=AsyncESLoader(settings.es_url, settings.es_index),
+            queue_size=settings.pipeline_queue_size,
+            concurrency=settings.bulk_concurrency,
+        )
+
+    def run_once(self, film_work_ids: set[str] | None = None) -> bool:
+        """Одна итерация переноса всех накопившихся изменений через конвейер.
+
+        Args:
+            film_work_ids: Фильмы из уведомлений об изменении связей, загружаемые вне отметок таблиц.
+
+        Returns:
+            bool: Продвинулась ли отметка хотя бы одной таблицы.
+        """
+        documents = itertools.chain(
+            self.extractor.get_data_by_ids(self.claim_work(film_work_ids)),
+            self.extractor.get_data(),
+        )
+        source = itertools.chain(
+            ((pg_data, watermarks, 'index') for pg_data, watermarks in documents),
+            ((partial_data, watermarks, 'update') for partial_data, watermarks in self.extractor.get_partial_data()),
+            ((ids, watermarks, 'delete') for ids, watermarks in self.get_deleted()),
+        )
+        try:
+            return self.event_loop.run_until_complete(self.pipeline.run(source))
+        finally:
+            self.state_maneger.flush()
+
+    def close(self) -> None:
+        """Освобождение соединений и цикла событий."""
+        super().close()
+        self.event_loop.run_until_complete(self.pipeline.loader.close())
+        self.event_loop.close()
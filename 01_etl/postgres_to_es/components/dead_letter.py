@@ -0,0 +1,38 @@
+import datetime
+import json
+import logging
+import threading
+from pathlib import Path
+
+
+class DeadLetterQueue:
+    """Локальный файл (JSON Lines) для документов, которые Elasticsearch отклонил без возможности повтора."""
+
+    def __init__(self, file_path: str) -> None:
+        """
+        Args:
+            file_path: Путь к файлу '*.jsonl'.
+        """
+        self.file_path = file_path
+        self.lock = threading.Lock()
+
+    def put(self, operation: bytes, item: dict) -> None:
+        """Сохранить отклонённую операцию bulk.
+
+        Args:
+            operation: Операция bulk в формате NDJSON (действие + документ).
+            item: Ответ Elasticsearch для операции.
+        """
+        record = {
+            'time': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'index': item.get('_index'),
+            'id': item.get('_id'),
+            'status': item.get('status'),
+            'error': item.get('error'),
+            'operation': operation.decode(),
+        }
+        with self.lock:
+            Path(self.file_path).parent.mkdir(parents=True, exist_ok=True)
+            with open(self.file_path, 'a', encoding='utf-8') as file:
+                file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        logging.error(f'Документ {record["id"]} отклонён Elasticsearch ({record["status"]}): {record["error"]}')
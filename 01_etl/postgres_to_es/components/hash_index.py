@@ -0,0 +1,221 @@
+import abc
+import json
+import logging
+import threading
+from pathlib import Path
+from typing import Iterable, Optional
+
+from redis import Redis
+
+from . import log_config, models
+from .settings import get_settings
+from .state import write_file_atomic
+from .utilities import backoff
+
+
+class BaseHashIndex:
+    """Хэши последних загруженных в Elasticsearch документов: film_work.id -> хэш документа."""
+
+    @abc.abstractmethod
+    def get_many(self, ids: Iterable[str]) -> dict[str, str]:
+        """Получить хэши документов.
+
+        Args:
+            ids: Идентификаторы документов.
+
+        Returns:
+            hashes: Хэши известных документов.
+        """
+        pass
+
+    @abc.abstractmethod
+    def update(self, hashes: dict[str, str]) -> None:
+        """Сохранить хэши загруженных документов.
+
+        Args:
+            hashes: Хэши документов.
+        """
+        pass
+
+    @abc.abstractmethod
+    def delete(self, ids: Iterable[str]) -> None:
+        """Удалить хэши документов.
+
+        Args:
+            ids: Идентификаторы документов.
+        """
+        pass
+
+    @abc.abstractmethod
+    def clear(self) -> None:
+        """Удалить все хэши, например, после создания пустого индекса."""
+        pass
+
+
+class JsonFileHashIndex(BaseHashIndex):
+    """Хэши в файле JSON Lines.
+
+    Каждое изменение дописывается в конец файла строкой {id: хэш | null}, при загрузке
+    строки применяются по порядку. Когда строк становится больше compact_lines,
+    файл переписывается одной строкой с актуальными хэшами.
+    """
+
+    compact_lines = 1000
+
+    def __init__(self, file_path: Optional[str] = None):
+        """
+        Args:
+            file_path: Путь к файлу '*.jsonl', по умолчанию из настроек.
+        """
+        self.file_path = file_path or get_settings().hash_index_file
+        self.lock = threading.Lock()
+        self.hashes = {}
+        self.lines = 0
+        self.load()
+
+    def load(self) -> None:
+        """Загрузка хэшей из файла."""
+        try:
+            with open(self.file_path, 'r', encoding='utf-8') as file:
+                for line in file:
+                    try:
+                        self.apply(json.loads(line))
+                    except ValueError:
+                        logging.warning(f'Пропущена повреждённая строка файла хэшей {self.file_path}')
+                    self.lines += 1
+        except FileNotFoundError:
+            return
+        if self.lines > self.compact_lines:
+            self.compact()
+
+    def apply(self, changes: dict[str, Optional[str]]) -> None:
+        """Применение строки изменений к хэшам в памяти.
+
+        Args:
+            changes: Хэши документов, None - хэш удалён.
+        """
+        for doc_id, digest in changes.items():
+            if digest is None:
+                self.hashes.pop(doc_id, None)
+            else:
+                self.hashes[doc_id] = digest
+
+    def append(self, changes: dict[str, Optional[str]]) -> None:
+        """Запись строки изменений в конец файла.
+
+        Args:
+            changes: Хэши документов, None - хэш удалён.
+        """
+        with self.lock:
+            self.apply(changes)
+            Path(self.file_path).parent.mkdir(parents=True, exist_ok=True)
+            with open(self.file_path, 'a', encoding='utf-8') as file:
+                file.write(json.dumps(changes) + '\n')
+            self.lines += 1
+            if self.lines > self.compact_lines:
+                self.compact()
+
+    def compact(self) -> None:
+        """Атомарная перезапись файла одной строкой с актуальными хэшами."""
+        write_file_atomic(self.file_path, json.dumps(self.hashes) + '\n')
+        self.lines = 1
+
+    def get_many(self, ids: Iterable[str]) -> dict[str, str]:
+        """Получить хэши документов.
+
+        Args:
+            ids: Идентификаторы документов.
+
+        Returns:
+            hashes: Хэши известных документов.
+        """
+        return {doc_id: self.hashes[doc_id] for doc_id in ids if doc_id in self.hashes}
+
+    def update(self, hashes: dict[str, str]) -> None:
+        """Сохранить хэши загруженных документов.
+
+        Args:
+            hashes: Хэши документов.
+        """
+        if hashes:
+            self.append(hashes)
+
+    def delete(self, ids: Iterable[str]) -> None:
+        """Удалить хэши документов.
+
+        Args:
+            ids: Идентификаторы документов.
+        """
+        changes = {doc_id: None for doc_id in ids}
+        if changes:
+            self.append(changes)
+
+    def clear(self) -> None:
+        """Удалить все хэши."""
+        with self.lock:
+            self.hashes = {}
+            self.compact()
+
+
+class RedisHashIndex(BaseHashIndex):
+    """Хэши в hash Redis: поле - film_work.id, значение - хэш документа."""
+
+    def __init__(self, dsl: Optional[models.RedisConf] = None, key: Optional[str] = None):
+        """
+        Args:
+            dsl: Данные для подключения к Redis, по умолчанию из настроек.
+            key: Ключ для Redis, по умолчанию из настроек.
+        """
+        self.dsl = dsl or get_settings().dsl_redis
+        self.key = key or get_settings().hash_index_key
+        self.connection = self.get_connection()
+
+    @backoff(logger=log_config.get_log, dependency='redis')
+    def get_connection(self) -> Redis:
+        """Реализация отказоустойчивости.
+
+        Returns:
+            Redis: Конектор.
+        """
+        return Redis(**self.dsl, decode_responses=True)
+
+    def get_many(self, ids: Iterable[str]) -> dict[str, str]:
+        """Получить хэши документов.
+
+        Args:
+            ids: Идентификаторы документов.
+
+        Returns:
+            hashes: Хэши известных документов.
+        """
+        ids = list(ids)
+        if not ids:
+            return {}
+        return {
+            doc_id: digest
+            for doc_id, digest in zip(ids, self.connection.hmget(self.key, ids))
+            if digest is not None
+        }
+
+    def update(self, hashes: dict[str, str]) -> None:
+        """Сохранить хэши загруженных документов.
+
+        Args:
+            hashes: Хэши документов.
+        """
+        if hashes:
+            self.connection.hset(self.key, mapping=hashes)
+
+    def delete(self, ids: Iterable[str]) -> None:
+        """Удалить хэши документов.
+
+        Args:
+            ids: Идентификаторы документов.
+        """
+        ids = list(ids)
+        if ids:
+            self.connection.hdel(self.key, *ids)
+
+    def clear(self) -> None:
+        """Удалить все хэши."""
+        self.connection.delete(self.key)
@@ -0,0 +1,208 @@
+import logging
+import math
+import os
+import socket
+import threading
+import time
+import uuid
+from typing import Iterable, Optional
+
+from redis import Redis
+
+
+class LeaseLostError(RuntimeError):
+    """Аренда участка работы истекла или перешла к другому процессу."""
+
+
+class LeaseManager:
+    """Аренда участков работы (таблиц-источников) в Redis для нескольких реплик ETL.
+
+    Участок обрабатывает только процесс, владеющий его арендой: ключ {prefix}:lease:{name}
+    со случайным токеном владельца и временем жизни ttl. Аренда продлевается фоновым потоком;
+    продление и освобождение выполняются скриптами Lua только при совпадении токена.
+
+    Живые реплики отмечаются в sorted set {prefix}:replicas (время последней отметки), и каждая
+    берёт не больше справедливой доли участков - ceil(участков / реплик). Лишние участки
+    освобождаются в начале итерации, поэтому работа перераспределяется при запуске новой реплики.
+    """
+
+    renew_lua = """
+        if redis.call('get', KEYS[1]) == ARGV[1] then
+            return redis.call('pexpire', KEYS[1], ARGV[2])
+        end
+        return 0
+    """
+    release_lua = """
+        if redis.call('get', KEYS[1]) == ARGV[1] then
+            return redis.call('del', KEYS[1])
+        end
+        return 0
+    """
+
+    def __init__(self, connection: Redis, prefix: str, ttl: float = 60, owner: Optional[str] = None) -> None:
+        """
+        Args:
+            connection: Конектор Redis.
+            prefix: Префикс ключей аренды.
+            ttl: Время жизни аренды без продления, секунд.
+            owner: Имя владельца для токенов, по умолчанию host:pid.
+        """
+        self.connection = connection
+        self.prefix = prefix
+        self.ttl_ms = int(ttl * 1000)
+        self.owner = owner or f'{socket.gethostname()}:{os.getpid()}'
+        self.held = {}
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.heartbeat = None
+        self.renew_script = connection.register_script(self.renew_lua)
+        self.release_script = connection.register_script(self.release_lua)
+
+    def get_key(self, name: str) -> str:
+        """Ключ аренды участка.
+
+        Args:
+            name: Имя участка.
+
+        Returns:
+            str: Ключ Redis.
+        """
+        return f'{self.prefix}:lease:{name}'
+
+    def acquire(self, name: str) -> bool:
+        """Получение | продление аренды участка.
+
+        Args:
+            name: Имя участка.
+
+        Returns:
+            bool: Аренда принадлежит этому процессу.
+        """
+        with self.lock:
+            if name in self.held:
+                return self.renew(name)
+            token = f'{self.owner}:{uuid.uuid4().hex}'
+            if self.connection.set(self.get_key(name), token, nx=True, px=self.ttl_ms):
+                self.held[name] = token
+                logging.info(f'Получена аренда {name}')
+                return True
+            return False
+
+    def register(self) -> int:
+        """Отметка процесса среди живых реплик.
+
+        Returns:
+            int: Количество живых реплик, включая этот процесс.
+        """
+        key = f'{self.prefix}:replicas'
+        now = time.time()
+        pipe = self.connection.pipeline()
+        pipe.zadd(key, {self.owner: now})
+        pipe.zremrangebyscore(key, '-inf', now - self.ttl_ms / 1000)
+        pipe.zcard(key)
+        return max(pipe.execute()[-1], 1)
+
+    def acquire_many(self, names: Iterable[str]) -> set[str]:
+        """Получение аренды справедливой доли участков.
+
+        Сначала продлевается аренда уже принадлежащих процессу участков (сверх доли - освобождается),
+        затем доля добирается свободными участками в порядке names.
+
+        Args:
+            names: Имена участков.
+
+        Returns:
+            set: Участки, принадлежащие этому процессу.
+        """
+        names = list(names)
+        limit = math.ceil(len(names) / self.register())
+        with self.lock:
+            held = [name for name in names if name in self.held]
+        for name in held[limit:]:
+            self.release(name)
+        acquired = {name for name in held[:limit] if self.acquire(name)}
+        for name in names:
+            if len(acquired) >= limit:
+                break
+            if name not in acquired and self.acquire(name):
+                acquired.add(name)
+        return acquired
+
+    def renew(self, name: str) -> bool:
+        """Продление аренды участка, вызывается под self.lock.
+
+        Args:
+            name: Имя участка.
+
+        Returns:
+            bool: Аренда продлена.
+        """
+        if self.renew_script(keys=[self.get_key(name)], args=[self.held[name], self.ttl_ms]):
+            return True
+        self.held.pop(name)
+        logging.warning(f'Аренда {name} потеряна')
+        return False
+
+    def renew_all(self) -> None:
+        """Продление аренды всех участков процесса и отметки реплики."""
+        self.register()
+        with self.lock:
+            for name in list(self.held):
+                self.renew(name)
+
+    def guards(self, names: Iterable[str]) -> dict[str, str]:
+        """Ключи и токены аренды для проверки при сохранении отметок.
+
+        Args:
+            names: Имена участков.
+
+        Returns:
+            dict: Ключ аренды -> токен.
+
+        Raises:
+            LeaseLostError: Процесс не владеет арендой одного из участков.
+        """
+        with self.lock:
+            lost = [name for name in names if name not in self.held]
+            if lost:
+                raise LeaseLostError(f'Нет аренды участков: {lost}')
+            return {self.get_key(name): self.held[name] for name in names}
+
+    def release(self, name: str) -> None:
+        """Освобождение аренды участка.
+
+        Args:
+            name: Имя участка.
+        """
+        with self.lock:
+            token = self.held.pop(name, None)
+            if token is not None:
+                self.release_script(keys=[self.get_key(name)], args=[token])
+                logging.info(f'Аренда {name} освобождена для других реплик')
+
+    def release_all(self) -> None:
+        """Освобождение аренды всех участков процесса."""
+        with self.lock:
+            for name, token in self.held.items():
+                self.release_script(keys=[self.get_key(name)], args=[token])
+            self.held = {}
+        self.connection.zrem(f'{self.prefix}:replicas', self.owner)
+
+    def start(self) -> None:
+        """Запуск фонового продления аренды каждые ttl / 3."""
+        def run() -> None:
+            while not self.stop_event.wait(self.ttl_ms / 3000):
+                try:
+                    self.renew_all()
+                except Exception as er:
+                    logging.error(f'Ошибка продления аренды: {er}')
+
+        self.heartbeat = threading.Thread(target=run, name='lease-heartbeat', daemon=True)
+        self.heartbeat.start()
+
+    def stop(self) -> None:
+        """Остановка фонового продления и освобождение аренды."""
+        self.stop_event.set()
+        if self.heartbeat is not None:
+            self.heartbeat.join()
+        self.release_all()
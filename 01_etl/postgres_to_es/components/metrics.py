@@ -0,0 +1,118 @@
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Iterable, Iterator, TypeVar
+
+from prometheus_client import Counter, Histogram, start_http_server
+from prometheus_client.core import REGISTRY, CounterMetricFamily, GaugeMetricFamily
+
+from .state import State
+from .utilities import retry_stats
+
+T = TypeVar('T')
+
+ROWS_EXTRACTED = Counter('etl_rows_extracted_total', 'Строки, прочитанные из PostgreSQL.', ['kind'])
+DOCS_TRANSFORMED = Counter('etl_docs_transformed_total', 'Операции bulk, подготовленные к отправке.', ['action'])
+DOCS_SKIPPED = Counter('etl_docs_skipped_total', 'Документы, не отправленные из-за совпадения хэша.')
+BULK_DOCS = Counter('etl_bulk_docs_total', 'Операции, отправленные в Elasticsearch.')
+BULK_BYTES = Counter('etl_bulk_bytes_total', 'Объём отправленных в Elasticsearch bulk, байт.')
+BULK_REJECTED = Counter('etl_bulk_rejected_total', 'Операции, сохранённые в очередь недоставленных.')
+BULK_LATENCY = Histogram(
+    'etl_bulk_latency_seconds',
+    'Время загрузки одного чанка bulk, включая повторы.',
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+STAGE_SECONDS = Histogram(
+    'etl_stage_seconds',
+    'Время этапа ETL на одну пачку.',
+    ['stage'],
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+
+
+def timed_iter(iterable: Iterable[T], stage: str) -> Iterator[T]:
+    """Учёт времени получения каждого элемента итератора как времени этапа.
+
+    Args:
+        iterable: Итератор, например, генератор пачек PostgresExtractor.
+        stage: Имя этапа.
+
+    Yields:
+        item: Элементы итератора.
+    """
+    iterator = iter(iterable)
+    histogram = STAGE_SECONDS.labels(stage)
+    while True:
+        started = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        histogram.observe(time.perf_counter() - started)
+        yield item
+
+
+class RetryCollector:
+    """Счётчики backoff из utilities.retry_stats по зависимостям."""
+
+    names = {
+        'retries': 'Повторы вызовов после ошибки соединения.',
+        'sleep_seconds': 'Время ожидания между повторами, секунд.',
+        'circuit_opened': 'Размыкания предохранителя.',
+        'circuit_rejected': 'Вызовы, отклонённые разомкнутым предохранителем.',
+        'budget_exhausted': 'Отказы в повторе из-за исчерпанного бюджета.',
+    }
+
+    def collect(self) -> Iterator[CounterMetricFamily]:
+        """Метрики на момент запроса.
+
+        Yields:
+            CounterMetricFamily: Счётчик по зависимостям.
+        """
+        for name, documentation in self.names.items():
+            family = CounterMetricFamily(f'etl_backoff_{name}', documentation, labels=['dependency'])
+            for dependency, stats in list(retry_stats.items()):
+                family.add_metric([dependency], stats.get(name, 0))
+            yield family
+
+
+class LagCollector:
+    """Отставание индекса: текущее время минус modified отметки каждой таблицы."""
+
+    def __init__(self, state_maneger: State) -> None:
+        """
+        Args:
+            state_maneger: Состояние ETL с отметками таблиц.
+        """
+        self.state_maneger = state_maneger
+
+    def collect(self) -> Iterator[GaugeMetricFamily]:
+        """Метрики на момент запроса.
+
+        Yields:
+            GaugeMetricFamily: Отставание по таблицам, секунд.
+        """
+        family = GaugeMetricFamily(
+            'etl_replication_lag_seconds',
+            'Текущее время минус modified последней загруженной записи таблицы.',
+            labels=['table'],
+        )
+        now = datetime.now(timezone.utc)
+        for table, watermark in self.state_maneger.document.watermarks.items():
+            family.add_metric([table], (now - watermark.key()[0]).total_seconds())
+        yield family
+
+
+def start_server(port: int, state_maneger: State) -> None:
+    """Запуск HTTP-сервера /metrics в фоновом потоке.
+
+    Args:
+        port: Порт; 0 - метрики не публикуются.
+        state_maneger: Состояние ETL для расчёта отставания.
+    """
+    if not port:
+        return
+    REGISTRY.register(RetryCollector())
+    REGISTRY.register(LagCollector(state_maneger))
+    start_http_server(port)
+    logging.info(f'Метрики ETL доступны на порту {port}: /metrics')
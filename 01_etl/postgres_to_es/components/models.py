@@ -1,9 +1,13 @@
+import re
+from datetime import datetime, timezone
 from typing import TypedDict
 from uuid import UUID
 
 from pydantic import BaseModel, validator
 from pydantic.schema import List, Optional
 
+from .sql_queries import MIN_MODIFIED, MIN_UUID
+
 
 class DBConf(TypedDict):
     """TypedDict."""
@@ -56,6 +60,71 @@ class ESDataConf(TypedDict):
     genres: list[str]
 
 
+# Дата и время в свободном формате прежних версий ETL, например, '2021-01-01 00:0:00.000001'.
+LEGACY_MODIFIED_RE = re.compile(
+    r'^(\d{4})-(\d{1,2})-(\d{1,2})[ T](\d{1,2}):(\d{1,2}):(\d{1,2})(?:\.(\d{1,6}))?([+-]\d{2}(?::?\d{2})?|Z)?$',
+)
+
+
+def parse_modified(value: str) -> datetime:
+    """Разбор modified отметки.
+
+    Поддерживаются строки PostgreSQL ('+00'), Python ('+00:00') и значения прежних версий ETL
+    с неполными полями и без часового пояса; время без часового пояса считается UTC.
+
+    Args:
+        value: Строка modified.
+
+    Returns:
+        datetime: Время с часовым поясом.
+
+    Raises:
+        ValueError: Строка не является датой и временем.
+    """
+    value = value.strip()
+    try:
+        parsed = datetime.fromisoformat(re.sub(r'([+-]\d{2})$', r'\1:00', value))
+    except ValueError:
+        match = LEGACY_MODIFIED_RE.match(value)
+        if match is None:
+            raise
+        year, month, day, hour, minute, second, fraction, offset = match.groups()
+        offset = '+00:00' if offset in {None, 'Z'} else offset
+        if len(offset) == 3:
+            offset = f'{offset}:00'
+        elif ':' not in offset:
+            offset = f'{offset[:3]}:{offset[3:]}'
+        parsed = datetime.fromisoformat(
+            f'{int(year):04}-{int(month):02}-{int(day):02} {int(hour):02}:{int(minute):02}:{int(second):02}'
+            f'.{(fraction or "0").ljust(6, "0")}{offset}',
+        )
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+class Watermark(BaseModel):
+    """Позиция (modified, id) последней обработанной записи таблицы."""
+
+    modified: str = MIN_MODIFIED
+    id: str = MIN_UUID
+
+    def key(self) -> tuple[datetime, UUID]:
+        """Ключ для сравнения отметок: строки modified из PostgreSQL и Python отличаются форматом смещения.
+
+        Returns:
+            tuple: (modified, id).
+        """
+        return parse_modified(self.modified), UUID(self.id)
+
+
+class StateDocument(BaseModel):
+    """Версионированный документ состояния ETL."""
+
+    version: int = 1
+    watermarks: dict[str, Watermark] = {}
+
+
 class ESDocument(BaseModel):
     """Валидация данных для Elasticsearch."""
 
@@ -0,0 +1,90 @@
+import json
+import logging
+import select
+
+import psycopg2
+from psycopg2 import sql
+from psycopg2.extensions import connection as _connection
+
+from . import log_config, models
+from .utilities import backoff
+
+
+class PGListener:
+    """Ожидание уведомлений LISTEN/NOTIFY об изменениях в схеме content.
+
+    Уведомления отправляют триггеры уровня оператора content.notify_etl_changes() и
+    content.notify_etl_link_changes(): одно уведомление на оператор, а не на строку. Для таблиц
+    person_film_work | genre_film_work в уведомлении передаётся film_work_ids (до 100 фильмов),
+    так как эти изменения не видны по полю modified. film_work_id - формат строчных триггеров
+    до миграции movies 0007.
+    """
+
+    def __init__(self, dsl: models.DBConf, channel: str) -> None:
+        """
+        Args:
+            dsl: Данные для подключения к psql.
+            channel: Канал LISTEN/NOTIFY.
+        """
+        self.dsl = dsl
+        self.channel = channel
+        self.connection = None
+
+    @backoff(logger=log_config.get_log, dependency='postgres')
+    def connect(self) -> _connection:
+        """
+        Открытие отдельного соединения в режиме autocommit и подписка на канал.
+
+        Returns:
+            _connection: Конектор.
+        """
+        connection = psycopg2.connect(**self.dsl)
+        connection.set_session(autocommit=True)
+        with connection.cursor() as cursor:
+            cursor.execute(sql.SQL('LISTEN {};').format(sql.Identifier(self.channel)))
+        logging.info(f'Подписка на канал {self.channel}')
+        return connection
+
+    def listen(self) -> None:
+        """Подписка на канал, если соединение ещё не открыто или было потеряно."""
+        if self.connection is None or self.connection.closed:
+            self.connection = self.connect()
+
+    def wait(self, timeout: float) -> set[str] | None:
+        """
+        Ожидание уведомлений на сокете соединения.
+
+        Args:
+            timeout: Максимальное время ожидания (сек.).
+
+        Returns:
+            ids: film_work.id из уведомлений об изменении связей | None, если уведомлений не было.
+                 После переподключения возвращается пустое множество: уведомления
+                 могли быть пропущены, и изменения нужно проверить опросом.
+        """
+        if self.connection is None or self.connection.closed:
+            self.listen()
+            return set()
+        try:
+            if select.select([self.connection], [], [], timeout) == ([], [], []):
+                return None
+            self.connection.poll()
+        except (psycopg2.OperationalError, psycopg2.InterfaceError) as er:
+            logging.error(er)
+            self.close()
+            return set()
+
+        ids = set()
+        for notify in self.connection.notifies:
+            payload = json.loads(notify.payload)
+            ids.update(payload.get('film_work_ids') or ())
+            if film_work_id := payload.get('film_work_id'):
+                ids.add(film_work_id)
+        self.connection.notifies.clear()
+        return ids
+
+    def close(self) -> None:
+        """Закрытие соединения."""
+        if self.connection is not None and not self.connection.closed:
+            self.connection.close()
+        self.connection = None
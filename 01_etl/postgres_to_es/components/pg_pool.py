@@ -0,0 +1,147 @@
+import logging
+import time
+from contextlib import contextmanager
+from typing import Generator
+
+import psycopg2
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+from psycopg2.extensions import connection as _connection
+from psycopg2.extras import DictCursor
+from psycopg2.pool import ThreadedConnectionPool
+
+from . import log_config, models
+from .utilities import backoff
+
+
+class PGConnectionPool:
+    """Пул постоянных соединений с PostgreSQL с проверкой их работоспособности."""
+
+    def __init__(
+            self,
+            dsl: models.DBConf,
+            minconn: int = 1,
+            maxconn: int = 4,
+            health_check_interval: float = 30,
+            cursor_factory=DictCursor) -> None:
+        """
+        Args:
+            dsl: Данные для подключения к psql.
+            minconn: Количество соединений, открываемых при создании пула.
+            maxconn: Максимальное количество соединений в пуле.
+            health_check_interval: Время простоя соединения (сек.), после которого оно проверяется запросом.
+            cursor_factory: Курсор.
+        """
+        self.dsl = dsl
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.health_check_interval = health_check_interval
+        self.cursor_factory = cursor_factory
+        self.pool = None
+        self.last_used = {}
+
+    def create_pool(self) -> ThreadedConnectionPool:
+        """Создание пула соединений.
+
+        Returns:
+            ThreadedConnectionPool: Пул соединений.
+        """
+        return ThreadedConnectionPool(
+            self.minconn,
+            self.maxconn,
+            **self.dsl,
+            cursor_factory=self.cursor_factory,
+        )
+
+    def is_alive(self, conn: _connection) -> bool:
+        """Проверка работоспособности соединения.
+
+        Запрос к серверу выполняется, только если соединение простаивало
+        дольше health_check_interval.
+
+        Args:
+            conn: Конектор.
+
+        Returns:
+            bool: Соединение можно использовать.
+        """
+        if conn.closed or conn.info.transaction_status != TRANSACTION_STATUS_IDLE:
+            return False
+        if time.monotonic() - self.last_used.get(id(conn), 0) < self.health_check_interval:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            conn.rollback()
+        except psycopg2.Error:
+            return False
+        return True
+
+    def discard(self, conn: _connection) -> None:
+        """Закрытие неработоспособного соединения и удаление его из пула.
+
+        Args:
+            conn: Конектор.
+        """
+        self.last_used.pop(id(conn), None)
+        self.pool.putconn(conn, close=True)
+
+    @backoff(logger=log_config.get_log, dependency='postgres')
+    def get_connection(self) -> _connection:
+        """
+        Получение проверенного соединения из пула.
+
+        Реализация отказоустойчивости: при недоступности psql пул пересоздаётся.
+
+        Returns:
+            _connection: Конектор.
+        """
+        if self.pool is None or self.pool.closed:
+            self.pool = self.create_pool()
+        conn = self.pool.getconn()
+        if not self.is_alive(conn):
+            self.discard(conn)
+            raise psycopg2.OperationalError('Соединение с PostgreSQL разорвано')
+        return conn
+
+    @contextmanager
+    def connection(self) -> Generator[_connection, None, None]:
+        """
+        Контекстный менеджер для соединения из пула.
+
+        После использования транзакция завершается, а соединение возвращается в пул.
+
+        Yields:
+            _connection: Конектор.
+        """
+        conn = self.get_connection()
+        try:
+            yield conn
+            conn.commit()
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            self.discard(conn)
+            raise
+        except BaseException:
+            if not conn.closed:
+                conn.rollback()
+            self.release(conn)
+            raise
+        else:
+            self.release(conn)
+
+    def release(self, conn: _connection) -> None:
+        """Возврат соединения в пул.
+
+        Args:
+            conn: Конектор.
+        """
+        if conn.closed:
+            self.discard(conn)
+            return
+        self.last_used[id(conn)] = time.monotonic()
+        self.pool.putconn(conn)
+
+    def close(self) -> None:
+        """Закрытие всех соединений пула."""
+        if self.pool is not None and not self.pool.closed:
+            self.pool.closeall()
+            logging.info('Соединения с PostgreSQL закрыты')
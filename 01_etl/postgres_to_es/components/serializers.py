@@ -0,0 +1,75 @@
+import json
+import logging
+from typing import Any, Callable
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+def orjson_dumps(data: Any) -> bytes:
+    """Сериализация в JSON через orjson.
+
+    Args:
+        data: Данные.
+
+    Returns:
+        bytes: JSON в UTF-8.
+    """
+    return orjson.dumps(data)
+
+
+def ujson_dumps(data: Any) -> bytes:
+    """Сериализация в JSON через ujson.
+
+    Args:
+        data: Данные.
+
+    Returns:
+        bytes: JSON в UTF-8.
+    """
+    return ujson.dumps(data, ensure_ascii=False).encode()
+
+
+def json_dumps(data: Any) -> bytes:
+    """Сериализация в JSON через стандартный модуль json.
+
+    Args:
+        data: Данные.
+
+    Returns:
+        bytes: JSON в UTF-8.
+    """
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'), default=str).encode()
+
+
+BACKENDS = {
+    'orjson': (orjson, orjson_dumps),
+    'ujson': (ujson, ujson_dumps),
+    'json': (json, json_dumps),
+}
+
+
+def get_dumps(backend: str = 'auto') -> Callable[[Any], bytes]:
+    """Выбор функции сериализации.
+
+    Args:
+        backend: 'orjson' | 'ujson' | 'json' | 'auto' - первый установленный в этом порядке.
+
+    Returns:
+        dumps: Функция сериализации в bytes.
+    """
+    names = list(BACKENDS) if backend == 'auto' else [backend, 'json']
+    for name in names:
+        module, dumps = BACKENDS[name]
+        if module is not None:
+            logging.info(f'Сериализация JSON: {name}')
+            return dumps
+        logging.warning(f'Модуль {name} не установлен')
+    return json_dumps
@@ -1,4 +1,5 @@
 import os
+from functools import lru_cache
 
 from pydantic import BaseSettings
 
@@ -13,6 +14,40 @@ class Settings(BaseSettings):
     es_url: str = os.environ.get('ES_URL')
     state_key: str = os.environ.get('STATE_KEY')
     state_file: str = os.environ.get('STATE_FILE')
+    state_flush_every: int = int(os.environ.get('STATE_FLUSH_EVERY', 1))
+    state_flush_interval: float = float(os.environ.get('STATE_FLUSH_INTERVAL', 0))
+    state_backend: str = os.environ.get('STATE_BACKEND', 'file')
+    lease_ttl: float = float(os.environ.get('ETL_LEASE_TTL', 60))
+    pg_pool_minconn: int = int(os.environ.get('PG_POOL_MINCONN', 1))
+    pg_pool_maxconn: int = int(os.environ.get('PG_POOL_MAXCONN', 4))
+    pg_health_check_interval: float = float(os.environ.get('PG_HEALTH_CHECK_INTERVAL', 30))
+    time_to_sleep: float = float(os.environ.get('ETL_TIME_TO_SLEEP', 2))
+    batch_size: int = int(os.environ.get('ETL_BATCH_SIZE', 10))
+    change_overlap: float = float(os.environ.get('ETL_CHANGE_OVERLAP', 10))
+    use_notify: bool = os.environ.get('ETL_USE_NOTIFY', 'True') == 'True'
+    notify_poll_interval: float = float(os.environ.get('ETL_NOTIFY_POLL_INTERVAL', 30))
+    pipeline_mode: str = os.environ.get('ETL_PIPELINE_MODE', 'sync')
+    pipeline_queue_size: int = int(os.environ.get('ETL_PIPELINE_QUEUE_SIZE', 4))
+    bulk_concurrency: int = int(os.environ.get('ES_BULK_CONCURRENCY', 2))
+    bulk_max_docs: int = int(os.environ.get('ES_BULK_MAX_DOCS', 500))
+    bulk_max_bytes: int = int(os.environ.get('ES_BULK_MAX_BYTES', 10 * 1024 * 1024))
+    bulk_refresh_threshold: int = int(os.environ.get('ES_BULK_REFRESH_THRESHOLD', 5000))
+    bulk_item_retries: int = int(os.environ.get('ES_BULK_ITEM_RETRIES', 5))
+    json_backend: str = os.environ.get('ETL_JSON_BACKEND', 'auto')
+    validate_sample_rate: float = float(os.environ.get('ETL_VALIDATE_SAMPLE_RATE', 0))
+    breaker_failure_threshold: int = int(os.environ.get('BREAKER_FAILURE_THRESHOLD', 5))
+    breaker_reset_timeout: float = float(os.environ.get('BREAKER_RESET_TIMEOUT', 30))
+    retry_budget_ratio: float = float(os.environ.get('RETRY_BUDGET_RATIO', 0.2))
+    retry_budget_min: int = int(os.environ.get('RETRY_BUDGET_MIN', 10))
+    metrics_port: int = int(os.environ.get('ETL_METRICS_PORT', 8001))
+    dead_letter_file: str = os.environ.get('ES_DEAD_LETTER_FILE', './data/dead_letter.jsonl')
+    skip_unchanged: bool = os.environ.get('ETL_SKIP_UNCHANGED', 'True') == 'True'
+    partial_update: bool = os.environ.get('ETL_PARTIAL_UPDATE', 'True') == 'True'
+    propagate_deletes: bool = os.environ.get('ETL_PROPAGATE_DELETES', 'True') == 'True'
+    hash_index_file: str = os.environ.get('HASH_INDEX_FILE', './data/document_hashes.jsonl')
+    hash_index_key: str = os.environ.get('REDIS_HASH_INDEX_KEY', 'etl_document_hashes')
+    reindex_workers: int = int(os.environ.get('REINDEX_WORKERS', os.cpu_count() or 1))
+    reindex_state_dir: str = os.environ.get('REINDEX_STATE_DIR', './data/reindex')
     dsl_pg: DBConf = {
         'host': os.environ.get('DB_HOST'),
         'database': os.environ.get('DB_NAME'),
@@ -24,4 +59,17 @@ class Settings(BaseSettings):
         'host': os.environ.get('REDIS_HOST'),
         'port': int(os.environ.get('REDIS_PORT')),
         'db': os.environ.get('REDIS_DB'),
-    }
\ No newline at end of file
+    }
+
+    class Config:
+        frozen = True
+
+
+@lru_cache
+def get_settings() -> Settings:
+    """Настройки ETL, прочитанные из окружения один раз за время работы процесса.
+
+    Returns:
+        Settings: Неизменяемый объект настроек.
+    """
+    return Settings()
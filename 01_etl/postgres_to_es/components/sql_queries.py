@@ -1,74 +1,120 @@
-import datetime
-from typing import Generator
+MIN_UUID = '00000000-0000-0000-0000-000000000000'
 
-from .settings import Settings
+MAX_UUID = 'ffffffff-ffff-ffff-ffff-ffffffffffff'
 
+MIN_MODIFIED = '2021-01-01 00:00:00.000001+00'
 
-def get_query(last_update_time: datetime) -> Generator[str, None, None]:
+# Канал LISTEN/NOTIFY; задан в триггерах content.notify_etl_changes() и content.notify_etl_link_changes()
+# (миграция movies 0007) и не настраивается.
+NOTIFY_CHANNEL = 'etl_changes'
+
+SHARD_IDS_QUERY = """
+    SELECT id
+    FROM content.film_work
+    WHERE id > %s::uuid AND id <= %s::uuid
+    ORDER BY id
+    LIMIT %s
+"""
+
+RELATED_FILM_WORK_QUERY = {
+    'person': """
+        SELECT DISTINCT pfw.film_work_id
+        FROM content.person_film_work pfw
+        WHERE pfw.person_id = ANY(%s::uuid[])
+    """,
+    'genre': """
+        SELECT DISTINCT gfw.film_work_id
+        FROM content.genre_film_work gfw
+        WHERE gfw.genre_id = ANY(%s::uuid[])
+    """,
+}
+
+# Жанры и участники фильма собраны триггерами в content.film_work_document (миграция movies 0006),
+# поэтому запросы читают готовые массивы по первичному ключу, без JOIN связей и GROUP BY.
+PERSON_FIELDS = """
+    doc.director,
+    doc.actors_names,
+    doc.writers_names,
+    doc.actors,
+    doc.writers"""
+
+GENRE_FIELDS = """
+    doc.genres"""
+
+# Поля документа, которые зависят только от изменившейся таблицы, для частичного обновления (update) в Elasticsearch.
+PARTIAL_UPDATE_QUERY = {
+    'person': f"""
+        SELECT
+        doc.id::text AS id,{PERSON_FIELDS}
+        FROM content.film_work_document doc
+        WHERE doc.id IN (
+            SELECT film_work_id FROM content.person_film_work WHERE person_id = ANY(%s::uuid[])
+        )
+        ORDER BY doc.id
+    """,
+    'genre': f"""
+        SELECT
+        doc.id::text AS id,{GENRE_FIELDS}
+        FROM content.film_work_document doc
+        WHERE doc.id IN (
+            SELECT film_work_id FROM content.genre_film_work WHERE genre_id = ANY(%s::uuid[])
+        )
+        ORDER BY doc.id
+    """,
+}
+
+# Журнал удалённых фильмов, заполняется триггером content.log_film_work_deleted.
+DELETED_TABLE = 'film_work_deleted'
+
+# Фильмы из журнала удалений, которых нет в content.film_work (id мог быть создан заново).
+DELETED_FILM_WORK_QUERY = """
+    SELECT d.id::text
+    FROM unnest(%s::uuid[]) AS d(id)
+    WHERE NOT EXISTS (SELECT 1 FROM content.film_work fw WHERE fw.id = d.id)
+"""
+
+
+def get_changes_query(table: str) -> str:
     """
-    Функция собирает qsl запросы для таблиц 'film_work', 'person', 'genre'.
+    Функция собирает sql запрос для поиска изменившихся записей таблицы.
 
-    Результат поиска - список film_work.id
+    Запрос использует keyset-пагинацию по (modified, id) и читает одну таблицу по индексу,
+    без JOIN и GROUP BY.
 
     Args:
-        last_update_time: Начальное время повтора.
+        table: Имя таблицы из Settings().pg_models.
 
-    Yields:
-        query: Генератор qsl запросов.
+    Returns:
+        query: Sql запрос с параметрами (modified, id, limit).
+    """
+    return f"""
+        SELECT id, modified
+        FROM content.{table}
+        WHERE (modified, id) > (%s::timestamptz, %s::uuid)
+        ORDER BY modified, id
+        LIMIT %s
     """
-    for table in Settings().pg_models:
-        query = f"""SELECT
-                    content.film_work.id
-                    FROM content.film_work
-                    LEFT JOIN content.person_film_work pfw ON pfw.film_work_id = content.film_work.id
-                    LEFT JOIN content.person ON content.person.id = pfw.person_id
-                    LEFT JOIN content.genre_film_work gfw ON gfw.film_work_id = content.film_work.id
-                    LEFT JOIN content.genre ON content.genre.id = gfw.genre_id
-                    WHERE content.{table}.modified > '{last_update_time}'
-                    GROUP BY content.film_work.id;"""
-        yield query
 
 
+# LEFT JOIN: фильм без строки в content.film_work_document (триггер был отключен при загрузке,
+# БД восстановлена из дампа до миграции 0006) индексируется без жанров и участников, а не пропускается,
+# как и в API панели администратора (movies/api/v1/views.py).
 SQL_QUERY = """
     SELECT
-    fw.id,
+    fw.id::text AS id,
     fw.title,
-    fw.description,
-    fw.rating AS imdb_rating,
+    COALESCE (fw.description, '') AS description,
+    COALESCE (fw.rating, 0.0) AS imdb_rating,
     fw.type,
     to_char(fw.modified, 'YYYY-MM-DD HH24:MI:SS.FF6TZH') AS modified,
-    COALESCE (
-            string_agg(DISTINCT p.full_name, '')
-            FILTER(WHERE p.id is not null AND pfw.role = 'director'),
-            ''
-            ) AS director,
-    array_agg(DISTINCT p.full_name) FILTER(WHERE p.id is not null AND pfw.role = 'actor') AS actors_names,
-    array_agg(DISTINCT p.full_name) FILTER(WHERE p.id is not null AND pfw.role = 'writer') AS writers_names,
-    COALESCE (
-            json_agg(
-                DISTINCT jsonb_build_object(
-                    'id', p.id,
-                    'name', p.full_name
-                )
-            ) FILTER (WHERE p.id is not null AND pfw.role = 'actor'),
-            '[]'
-        ) as actors,
-    COALESCE (
-            json_agg(
-                DISTINCT jsonb_build_object(
-                    'id', p.id,
-                    'name', p.full_name
-                )
-            ) FILTER (WHERE p.id is not null AND pfw.role = 'writer'),
-            '[]'
-        ) as writers,
-    array_agg(DISTINCT g.name) as genres
+    COALESCE (doc.director, '') AS director,
+    COALESCE (doc.actors_names, '{}') AS actors_names,
+    COALESCE (doc.writers_names, '{}') AS writers_names,
+    COALESCE (doc.actors, '[]') AS actors,
+    COALESCE (doc.writers, '[]') AS writers,
+    COALESCE (doc.genres, '{}') AS genres
     FROM content.film_work fw
-    LEFT JOIN content.person_film_work pfw ON pfw.film_work_id = fw.id
-    LEFT JOIN content.person p ON p.id = pfw.person_id
-    LEFT JOIN content.genre_film_work gfw ON gfw.film_work_id = fw.id
-    LEFT JOIN content.genre g ON g.id = gfw.genre_id
-    WHERE fw.id IN (%s)
-    GROUP BY fw.id
-    ORDER BY modified
+    LEFT JOIN content.film_work_document doc ON doc.id = fw.id
+    WHERE fw.id = ANY(%s::uuid[])
+    ORDER BY fw.modified, fw.id
 """
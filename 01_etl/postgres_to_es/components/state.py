@@ -1,14 +1,45 @@
 import abc
+import copy
 import json
 import logging
-from typing import Optional
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Optional
 
 from redis import Redis
-import redis
+from redis.exceptions import WatchError
 
-from . import models, log_config
+from . import log_config, models, sql_queries
+from .leases import LeaseLostError, LeaseManager
 from .utilities import backoff
-from .settings import Settings
+from .settings import get_settings
+
+
+def write_file_atomic(file_path: str, content: str) -> None:
+    """Атомарная запись файла.
+
+    Содержимое записывается во временный файл рядом с основным, сбрасывается на диск (fsync)
+    и атомарно переименовывается, поэтому сбой во время записи оставляет предыдущую версию файла.
+
+    Args:
+        file_path: Путь к файлу.
+        content: Содержимое.
+    """
+    path = Path(file_path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f'.{path.name}.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        file.write(content)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+    dir_fd = os.open(path.parent, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
 
 
 class BaseStorage:
@@ -26,14 +57,64 @@ class BaseStorage:
         """Загрузить состояние локально из постоянного хранилища."""
         pass
 
+    def update_state(self, update: Callable[[dict], dict], guards: Optional[dict[str, str]] = None) -> dict:
+        """Изменить состояние: прочитать, применить update, сохранить.
+
+        Реализация по умолчанию не атомарна и подходит для одного процесса.
+
+        Args:
+            update: Функция нового состояния от текущего.
+            guards: Ключи и токены аренды, которые должны принадлежать процессу.
+
+        Returns:
+            state: Сохранённое состояние.
+        """
+        state = update(self.retrieve_state())
+        self.save_state(state)
+        return state
+
+    def flush(self) -> None:
+        """Записать отложенные изменения состояния, если хранилище их откладывает."""
+        pass
+
+
+class StateCorruptedError(RuntimeError):
+    """Файл состояния повреждён; продолжать с пустого состояния нельзя."""
+
 
 class JsonFileStorage(BaseStorage):
-    def __init__(self, file_path: Optional[str] = None):
+    """Состояние в файле JSON.
+
+    Файл записывается во временный файл рядом с основным, сбрасывается на диск (fsync)
+    и атомарно переименовывается, поэтому сбой во время записи оставляет предыдущую версию.
+    Записи можно объединять: на диск попадает каждое flush_every-е состояние
+    или состояние спустя flush_interval секунд после предыдущей записи, остальные - при flush().
+    """
+
+    def __init__(self, file_path: Optional[str] = None, flush_every: int = 1, flush_interval: float = 0):
         """
         Args:
             file_path: Путь к файлу '*.json'.
+            flush_every: Записывать на диск каждое N-е состояние.
+            flush_interval: Записывать на диск не реже, чем раз в T секунд (0 - не учитывать).
         """
         self.file_path = file_path
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.state = None
+        self.pending = 0
+        self.flushed_at = time.monotonic()
+
+    def write(self, state: dict) -> None:
+        """Атомарная запись состояния в файл.
+
+        Args:
+            state: Cостояние.
+        """
+        write_file_atomic(self.file_path, json.dumps(state, ensure_ascii=False, separators=(',', ':')))
+        self.pending = 0
+        self.flushed_at = time.monotonic()
 
     def save_state(self, state: dict) -> None:
         """Сохранить состояние в постоянное хранилище.
@@ -41,38 +122,59 @@ class JsonFileStorage(BaseStorage):
         Args:
             state: Cостояние.
         """
-        with open(self.file_path, 'w', encoding='utf-8') as file:
-            json.dump(state, file, ensure_ascii=False, indent=4)
+        with self.lock:
+            self.state = copy.deepcopy(state)
+            self.pending += 1
+            is_due = self.flush_interval and time.monotonic() - self.flushed_at >= self.flush_interval
+            if self.pending >= self.flush_every or is_due:
+                self.write(self.state)
+
+    def flush(self) -> None:
+        """Записать на диск состояние, отложенное объединением записей."""
+        with self.lock:
+            if self.pending:
+                self.write(self.state)
 
     def retrieve_state(self) -> dict:
         """Загрузить состояние локально из постоянного хранилища.
 
         Returns:
-            state: Cостояние.
+            state: Cостояние; пустое, если файла ещё нет.
+
+        Raises:
+            StateCorruptedError: Файл не читается как JSON-объект.
         """
-        try:
-            with open(self.file_path, 'r', encoding='utf-8') as file:
-                state = json.load(file)
-            return state
-        except FileNotFoundError:
-            self.save_state({})
-            return {}
-        except Exception:
-            return {}
+        with self.lock:
+            if self.state is not None:
+                return copy.deepcopy(self.state)
+            try:
+                with open(self.file_path, 'r', encoding='utf-8') as file:
+                    state = json.load(file)
+            except FileNotFoundError:
+                return {}
+            except (ValueError, UnicodeDecodeError) as er:
+                logging.error(f'Файл состояния {self.file_path} повреждён: {er}')
+                raise StateCorruptedError(
+                    f'Файл состояния {self.file_path} повреждён; восстановите его или удалите для полной загрузки',
+                ) from er
+            if not isinstance(state, dict):
+                raise StateCorruptedError(f'Файл состояния {self.file_path} не содержит JSON-объект')
+            self.state = state
+            return copy.deepcopy(state)
 
 
 class RedisStorage(BaseStorage):
-    def __init__(self, dsl: models.RedisConf = Settings().dsl_redis, key: str = Settings().redis_key):
+    def __init__(self, dsl: Optional[models.RedisConf] = None, key: Optional[str] = None):
         """
         Args:
-            dsl: Данные для подключения к Redis.
-            key: Ключ для Redis.
+            dsl: Данные для подключения к Redis, по умолчанию из настроек.
+            key: Ключ для Redis, по умолчанию из настроек.
         """
-        self.dsl = dsl
-        self.key = key
+        self.dsl = dsl or get_settings().dsl_redis
+        self.key = key or get_settings().redis_key
         self.connection = self.get_connection()
 
-    @backoff(logger=log_config.get_log)
+    @backoff(logger=log_config.get_log, dependency='redis')
     def get_connection(self) -> Redis:
         """Реализация отказоустойчивости.
 
@@ -84,13 +186,12 @@ class RedisStorage(BaseStorage):
     def save_state(self, state: dict) -> None:
         """Сохранить состояние в Redis.
 
+        Документ состояния сохраняется одной строкой JSON, поэтому запись атомарна.
+
         Args:
             state: Cостояние.
         """
-        if state:
-            self.connection.hset(self.key, mapping=state)
-        else:
-            self.connection.delete(self.key)
+        self.connection.set(self.key, json.dumps(state, ensure_ascii=False))
 
     def retrieve_state(self) -> dict:
         """Загрузить состояние из Redis.
@@ -98,36 +199,156 @@ class RedisStorage(BaseStorage):
         Returns:
             state: Cостояние.
         """
-        return self.connection.hgetall(self.key)
+        return self.read(self.connection)
+
+    def read(self, connection: Redis) -> dict:
+        """Чтение состояния через соединение | pipeline.
+
+        Args:
+            connection: Конектор Redis | pipeline в режиме WATCH.
+
+        Returns:
+            state: Cостояние.
+        """
+        if connection.type(self.key) == 'hash':
+            return connection.hgetall(self.key)
+        state = connection.get(self.key)
+        return json.loads(state) if state else {}
+
+    def update_state(self, update: Callable[[dict], dict], guards: Optional[dict[str, str]] = None) -> dict:
+        """Атомарно изменить состояние (WATCH/MULTI/EXEC).
+
+        Если ключ состояния или аренды изменился между чтением и записью, изменение повторяется
+        на свежих данных, поэтому отметки нескольких реплик не затирают друг друга.
+
+        Args:
+            update: Функция нового состояния от текущего.
+            guards: Ключи и токены аренды, которые должны принадлежать процессу.
+
+        Returns:
+            state: Сохранённое состояние.
+
+        Raises:
+            LeaseLostError: Аренда перешла к другому процессу.
+        """
+        guards = guards or {}
+        with self.connection.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(self.key, *guards)
+                    for key, token in guards.items():
+                        if pipe.get(key) != token:
+                            raise LeaseLostError(f'Аренда {key} принадлежит другому процессу')
+                    state = update(self.read(pipe))
+                    pipe.multi()
+                    pipe.set(self.key, json.dumps(state, ensure_ascii=False))
+                    pipe.execute()
+                    return state
+                except WatchError:
+                    continue
 
 
 class State:
-    """Класс для хранения состояния при работе с данными."""
+    """Класс для хранения состояния при работе с данными.
+
+    Состояние - документ models.StateDocument с отдельной отметкой (modified, id)
+    для каждой таблицы-источника. Документ всегда сохраняется целиком.
+    """
+
+    version = 1
 
-    def __init__(self, storage: BaseStorage):
+    def __init__(self, storage: BaseStorage, leases: Optional[LeaseManager] = None):
         """
         Args:
             storage: Объект класса JsonFileStorage | RedisFileStorage.
+            leases: Аренда таблиц; если задана, отметка сохраняется, только пока процесс владеет арендой таблицы.
         """
         self.storage = storage
-        self.data = self.storage.retrieve_state()
+        self.leases = leases
+        self.document = self.load_document(self.storage.retrieve_state())
 
-    def set_state(self, key: str, value: str) -> None:
-        """Установить состояние для определённого ключа.
+    def flush(self) -> None:
+        """Записать отложенные изменения состояния в хранилище."""
+        self.storage.flush()
+
+    def refresh(self) -> None:
+        """Перечитать состояние из хранилища (его могли изменить другие процессы)."""
+        self.document = self.load_document(self.storage.retrieve_state())
+
+    def load_document(self, data: dict) -> models.StateDocument:
+        """Разбор сохранённого состояния.
+
+        Состояние предыдущих версий ETL (строка с датой под ключом STATE_KEY
+        или STATE_KEY_<table>) переносится в отметки таблиц. Дата приводится к формату ISO 8601;
+        дата, которую не удаётся разобрать, заменяется на MIN_MODIFIED (полная загрузка таблицы).
 
         Args:
-            key: Ключ.
-            value: Состояние.
+            data: Состояние из хранилища.
+
+        Returns:
+            document: Документ состояния.
+        """
+        if 'version' in data:
+            return models.StateDocument.parse_obj(data)
+        settings = get_settings()
+        watermarks = {}
+        for table in settings.pg_models:
+            modified = data.get(f'{settings.state_key}_{table}') or data.get(settings.state_key)
+            if modified:
+                try:
+                    modified = models.parse_modified(modified).isoformat(sep=' ')
+                except ValueError:
+                    logging.warning(f'Отметка {table} предыдущей версии ETL не разобрана: {modified!r}')
+                    modified = sql_queries.MIN_MODIFIED
+                watermarks[table] = models.Watermark(modified=modified)
+        if data:
+            logging.warning('Состояние предыдущей версии ETL перенесено в новый формат')
+        return models.StateDocument(version=self.version, watermarks=watermarks)
+
+    def get_watermark(self, table: str) -> models.Watermark:
+        """Получить отметку последней обработанной записи таблицы.
+
+        Args:
+            table: Имя таблицы.
+
+        Returns:
+            watermark: Отметка (modified, id).
         """
-        self.storage.save_state({key: value})
+        return self.document.watermarks.get(table, models.Watermark())
 
-    def get_state(self, key: str) -> str:
-        """Получить состояние по определённому ключу.
+    def advances(self, watermarks: dict[str, models.Watermark]) -> bool:
+        """Продвигает ли вперёд хотя бы одна из отметок сохранённую отметку своей таблицы.
 
         Args:
-            key: Ключ.
+            watermarks: Отметки таблиц.
 
         Returns:
-            value: Состояние.
+            bool: Хотя бы одна отметка больше сохранённой.
         """
-        return self.data.get(key)
+        return any(
+            watermark.key() > self.get_watermark(table).key()
+            for table, watermark in watermarks.items()
+        )
+
+    def commit(self, watermarks: dict[str, models.Watermark]) -> None:
+        """Сохранить новые отметки таблиц одной записью в хранилище.
+
+        Отметки только продвигаются вперёд: отметка, которая меньше сохранённой, не применяется.
+
+        Args:
+            watermarks: Отметки таблиц.
+
+        Raises:
+            LeaseLostError: Процесс не владеет арендой одной из таблиц.
+        """
+        guards = self.leases.guards(watermarks) if self.leases is not None else None
+
+        def advance(data: dict) -> dict:
+            document = self.load_document(data)
+            for table, watermark in watermarks.items():
+                current = document.watermarks.get(table)
+                if current is None or watermark.key() > current.key():
+                    document.watermarks[table] = watermark
+            return document.dict()
+
+        self.document = models.StateDocument.parse_obj(self.storage.update_state(advance, guards))
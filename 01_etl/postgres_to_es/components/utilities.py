@@ -1,5 +1,10 @@
+import asyncio
+import inspect
 import logging
+import random
+import threading
 import time
+from collections import defaultdict
 from functools import wraps
 
 import elasticsearch
@@ -7,52 +12,353 @@ import psycopg2
 import redis
 
 from components import log_config
+from components.settings import get_settings
 
+# Ошибки соединения, после которых вызов повторяется, и зависимость, к которой они относятся.
+RETRY_EXCEPTIONS = {
+    'postgres': (psycopg2.OperationalError,),
+    'elasticsearch': (elasticsearch.TransportError,),
+    'redis': (redis.exceptions.ConnectionError,),
+}
 
-def backoff(start_sleep_time=0.1, factor=2, border_sleep_time=10, max_repeat=10, logger=log_config.get_log):
+ALL_RETRY_EXCEPTIONS = tuple(exc for excs in RETRY_EXCEPTIONS.values() for exc in excs)
+
+
+class CircuitOpenError(RuntimeError):
+    """Зависимость недоступна: вызов отклонён без обращения к ней."""
+
+
+class RetryBudgetExceeded(RuntimeError):
+    """Повторы к зависимости исчерпали бюджет."""
+
+
+class CircuitBreaker:
+    """Предохранитель для одной зависимости.
+
+    После failure_threshold ошибок подряд предохранитель размыкается: новые вызовы
+    завершаются CircuitOpenError без обращения к зависимости. Через reset_timeout
+    пропускается один пробный вызов; успех замыкает предохранитель, ошибка снова размыкает.
     """
-    Функция для повторного выполнения функции через некоторое время, если возникла ошибка.
 
-    Использует наивный экспоненциальный рост времени повтора (factor)
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30) -> None:
+        """
+        Args:
+            name: Имя зависимости.
+            failure_threshold: Количество ошибок подряд до размыкания.
+            reset_timeout: Время до пробного вызова, секунд.
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.opened_at = None
+        self.probe_started_at = None
+
+    def remaining(self) -> float:
+        """Время до пробного вызова.
 
-    до граничного времени ожидания (border_sleep_time).
+        Returns:
+            float: Секунд до пробного вызова, 0 - вызов можно выполнять.
+        """
+        if self.opened_at is None:
+            return 0
+        return max(self.opened_at + self.reset_timeout - time.monotonic(), 0)
+
+    def allow(self) -> bool:
+        """Можно ли обращаться к зависимости.
+
+        Returns:
+            bool: Предохранитель замкнут | разрешён пробный вызов.
+        """
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            now = time.monotonic()
+            if self.remaining() > 0:
+                return False
+            # Один пробный вызов на reset_timeout, остальные ждут его результата.
+            if self.probe_started_at is not None and now - self.probe_started_at < self.reset_timeout:
+                return False
+            self.probe_started_at = now
+            return True
+
+    def record_success(self) -> None:
+        """Успешный вызов замыкает предохранитель."""
+        with self.lock:
+            if self.opened_at is not None:
+                logging.info(f'Связь с {self.name} восстановлена')
+            self.failures = 0
+            self.opened_at = None
+            self.probe_started_at = None
+
+    def record_failure(self) -> None:
+        """Ошибка вызова; размыкает предохранитель после failure_threshold ошибок подряд."""
+        with self.lock:
+            self.failures += 1
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    retry_stats[self.name]['circuit_opened'] += 1
+                    logging.error(f'{self.name} недоступен, обращения приостановлены на {self.reset_timeout} с')
+                self.opened_at = time.monotonic()
+                self.probe_started_at = None
+
+
+class RetryBudget:
+    """Бюджет повторов для одной зависимости.
+
+    За окно window секунд повторов допускается не больше ratio от количества вызовов,
+    но не меньше min_retries. Так при отказе зависимости повторы не умножают нагрузку на неё.
+    """
+
+    def __init__(self, ratio: float = 0.2, min_retries: int = 10, window: float = 60) -> None:
+        """
+        Args:
+            ratio: Допустимая доля повторов от вызовов.
+            min_retries: Количество повторов, доступное всегда.
+            window: Длина окна, секунд.
+        """
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self.window = window
+        self.lock = threading.Lock()
+        self.window_start = time.monotonic()
+        self.calls = 0
+        self.retries = 0
+
+    def roll(self) -> None:
+        """Начало нового окна."""
+        if time.monotonic() - self.window_start >= self.window:
+            self.window_start = time.monotonic()
+            self.calls = 0
+            self.retries = 0
+
+    def record_call(self) -> None:
+        """Учёт первого вызова."""
+        with self.lock:
+            self.roll()
+            self.calls += 1
+
+    def withdraw(self) -> bool:
+        """Списание одного повтора из бюджета.
+
+        Returns:
+            bool: Повтор разрешён.
+        """
+        with self.lock:
+            self.roll()
+            if self.retries >= max(self.min_retries, self.ratio * self.calls):
+                return False
+            self.retries += 1
+            return True
+
+
+# Счётчики повторов по зависимостям: retries, sleep_seconds, circuit_opened, circuit_rejected, budget_exhausted.
+retry_stats = defaultdict(lambda: defaultdict(float))
+
+_breakers = {}
+_budgets = {}
+_registry_lock = threading.Lock()
+
+
+def get_circuit_breaker(dependency: str) -> CircuitBreaker:
+    """Предохранитель зависимости, общий для процесса.
+
+    Args:
+        dependency: 'postgres' | 'elasticsearch' | 'redis'.
+
+    Returns:
+        CircuitBreaker: Предохранитель.
+    """
+    with _registry_lock:
+        if dependency not in _breakers:
+            settings = get_settings()
+            _breakers[dependency] = CircuitBreaker(
+                dependency,
+                failure_threshold=settings.breaker_failure_threshold,
+                reset_timeout=settings.breaker_reset_timeout,
+            )
+        return _breakers[dependency]
+
+
+def get_retry_budget(dependency: str) -> RetryBudget:
+    """Бюджет повторов зависимости, общий для процесса.
+
+    Args:
+        dependency: 'postgres' | 'elasticsearch' | 'redis'.
+
+    Returns:
+        RetryBudget: Бюджет повторов.
+    """
+    with _registry_lock:
+        if dependency not in _budgets:
+            settings = get_settings()
+            _budgets[dependency] = RetryBudget(
+                ratio=settings.retry_budget_ratio,
+                min_retries=settings.retry_budget_min,
+            )
+        return _budgets[dependency]
+
+
+def get_dependency(er: Exception) -> str:
+    """Зависимость, к которой относится ошибка соединения.
+
+    Args:
+        er: Ошибка.
+
+    Returns:
+        str: Имя зависимости.
+    """
+    for dependency, exceptions in RETRY_EXCEPTIONS.items():
+        if isinstance(er, exceptions):
+            return dependency
+    return 'unknown'
+
+
+def backoff(
+    start_sleep_time=0.1,
+    factor=2,
+    border_sleep_time=10,
+    max_repeat=10,
+    logger=log_config.get_log,
+    dependency=None,
+):
+    """
+    Функция для повторного выполнения функции через некоторое время, если возникла ошибка соединения.
+
+    Время ожидания растёт экспоненциально (factor) до граничного (border_sleep_time)
+    и выбирается случайно от 0 до этой величины (full jitter), чтобы повторы разных
+    процессов не приходили к восстановившейся зависимости одновременно.
 
     Формула:
-        t = start_sleep_time * 2^(n) if t < border_sleep_time
-        t = border_sleep_time if t >= border_sleep_time
+        t = random(0, min(border_sleep_time, start_sleep_time * factor^n))
+
+    Для каждой зависимости ведутся предохранитель (CircuitBreaker) и бюджет повторов (RetryBudget).
+    Пока предохранитель разомкнут, новые вызовы завершаются CircuitOpenError без обращения к зависимости,
+    а уже начатые повторы ждут пробного вызова.
+
+    Поддерживает обычные функции, корутины и функции-генераторы. У генератора повторяется
+    итерация: ошибка соединения во время чтения перезапускает генератор, а успешным вызовом
+    считается каждый полученный элемент и завершение итерации, а не создание объекта генератора.
+    Перезапущенный генератор отдаёт элементы заново, поэтому его получатель должен быть идемпотентным
+    (генераторы PostgresExtractor начинают с сохранённых отметок).
 
     Args:
         start_sleep_time: Начальное время повтора.
         factor: Во сколько раз нужно увеличить время ожидания.
         border_sleep_time: Граничное время ожидания.
-        max_repeat: Максимальное количество вызовов декоратора backoff.
-        logger: Логгер.
+        max_repeat: Максимальное количество повторов одного вызова.
+        logger: Настройка логгирования, выполняется один раз при декорировании.
+        dependency: 'postgres' | 'elasticsearch' | 'redis'; без неё предохранитель не используется,
+            а бюджет и счётчики повторов относятся к зависимости, определённой по ошибке.
 
     Returns:
         func_wrapper: Результат выполнения функции.
     """
+    def get_sleep_time(attempt: int) -> float:
+        return random.uniform(0, min(border_sleep_time, start_sleep_time * factor ** attempt))
+
+    def before_call(attempt: int) -> float:
+        """Проверка предохранителя; возвращает время ожидания пробного вызова."""
+        if dependency is None:
+            return 0
+        breaker = get_circuit_breaker(dependency)
+        if breaker.allow():
+            if not attempt:
+                get_retry_budget(dependency).record_call()
+            return 0
+        if not attempt or attempt >= max_repeat:
+            retry_stats[dependency]['circuit_rejected'] += 1
+            raise CircuitOpenError(f'{dependency} недоступен, вызов отклонён')
+        return max(breaker.remaining(), start_sleep_time)
+
+    def on_success() -> None:
+        if dependency is not None:
+            get_circuit_breaker(dependency).record_success()
+
+    def on_failure(er: Exception, attempt: int) -> float:
+        """Учёт ошибки; возвращает время ожидания перед повтором."""
+        name = dependency or get_dependency(er)
+        open_remaining = 0
+        if dependency is not None:
+            breaker = get_circuit_breaker(dependency)
+            breaker.record_failure()
+            open_remaining = breaker.remaining()
+        if attempt >= max_repeat:
+            logging.error('Превышено количество повторов backoff')
+            raise RuntimeError('Превышено количество повторов backoff') from er
+        if not get_retry_budget(name).withdraw():
+            retry_stats[name]['budget_exhausted'] += 1
+            logging.error(f'Исчерпан бюджет повторов для {name}')
+            raise RetryBudgetExceeded(f'Исчерпан бюджет повторов для {name}') from er
+        sleep_time = max(get_sleep_time(attempt), open_remaining)
+        retry_stats[name]['retries'] += 1
+        retry_stats[name]['sleep_seconds'] += sleep_time
+        logging.error(f'{er}; повтор {attempt + 1} через {sleep_time:.2f} с')
+        return sleep_time
+
     def func_wrapper(func):
+        logger()
+
+        if asyncio.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_inner(*args, **kwargs):
+                attempt = 0
+                while True:
+                    wait = before_call(attempt)
+                    if wait:
+                        await asyncio.sleep(wait)
+                        attempt += 1
+                        continue
+                    try:
+                        result = await func(*args, **kwargs)
+                    except ALL_RETRY_EXCEPTIONS as er:
+                        await asyncio.sleep(on_failure(er, attempt))
+                        attempt += 1
+                    else:
+                        on_success()
+                        return result
+            return async_inner
+
+        if inspect.isgeneratorfunction(func):
+            @wraps(func)
+            def generator_inner(*args, **kwargs):
+                attempt = 0
+                while True:
+                    wait = before_call(attempt)
+                    if wait:
+                        time.sleep(wait)
+                        attempt += 1
+                        continue
+                    try:
+                        for item in func(*args, **kwargs):
+                            on_success()
+                            attempt = 0
+                            yield item
+                    except ALL_RETRY_EXCEPTIONS as er:
+                        time.sleep(on_failure(er, attempt))
+                        attempt += 1
+                    else:
+                        on_success()
+                        return
+            return generator_inner
+
         @wraps(func)
         def inner(*args, **kwargs):
-            logger()
-            count = 0
-            sleep_time = start_sleep_time
-            n = 1
+            attempt = 0
             while True:
+                wait = before_call(attempt)
+                if wait:
+                    time.sleep(wait)
+                    attempt += 1
+                    continue
                 try:
-                    return func(*args, **kwargs)
-                except (psycopg2.OperationalError, elasticsearch.TransportError, redis.exceptions.ConnectionError) as er:
-                    count += 1
-                    logging.error(er)
-                    time.sleep(sleep_time)
-                    if sleep_time >= border_sleep_time:
-                        sleep_time = border_sleep_time
-                    else:
-                        sleep_time = start_sleep_time * 2 ^ (n)
-                        n *= factor
-                finally:
-                    if count > max_repeat:
-                        logging.error('Превышено количество вызовов декоратора backoff')
-                        raise RuntimeError('Превышено количество вызовов декоратора backoff')
+                    result = func(*args, **kwargs)
+                except ALL_RETRY_EXCEPTIONS as er:
+                    time.sleep(on_failure(er, attempt))
+                    attempt += 1
+                else:
+                    on_success()
+                    return result
         return inner
     return func_wrapper
@@ -1,24 +1,68 @@
-import json
+import hashlib
+import logging
+import random
+from operator import itemgetter
+from typing import Iterator
 
-from components import models
-from components.settings import Settings
+from pydantic import ValidationError
+
+from components import metrics, models, serializers
+from components.hash_index import BaseHashIndex
+
+# Поле документа Elasticsearch -> колонка SQL_QUERY. Значения по умолчанию подставляются в самом запросе (COALESCE).
+ES_FIELDS = {
+    'id': 'id',
+    'imdb_rating': 'imdb_rating',
+    'genre': 'genres',
+    'title': 'title',
+    'description': 'description',
+    'director': 'director',
+    'actors_names': 'actors_names',
+    'writers_names': 'writers_names',
+    'actors': 'actors',
+    'writers': 'writers',
+}
 
 
 class DataTransformer:
+    def __init__(
+        self,
+        index_name: str,
+        json_backend: str = 'auto',
+        validate_sample_rate: float = 0,
+        hash_index: BaseHashIndex | None = None,
+    ) -> None:
+        """
+        Args:
+            index_name: Индекс Elasticsearch, в который загружаются документы.
+            json_backend: Библиотека сериализации JSON: 'orjson' | 'ujson' | 'json' | 'auto'.
+            validate_sample_rate: Доля документов (0..1), сверяемых с моделью ESDocument; 0 - без проверки.
+            hash_index: Хэши загруженных документов; если задан, неизменившиеся документы не отправляются.
+        """
+        self.index_name = index_name
+        self.hash_index = hash_index
+        self.dumps = serializers.get_dumps(json_backend)
+        self.validate_sample_rate = validate_sample_rate
+        # Строка действия одинакова для всей пачки, кроме _id: '{"index":{"_index":"movies","_id":"' + id + '"}}'
+        self.action_prefix = self.dumps({'index': {'_index': index_name}})[:-2] + b',"_id":"'
+        self.update_prefix = self.dumps({'update': {'_index': index_name}})[:-2] + b',"_id":"'
+        self.delete_prefix = self.dumps({'delete': {'_index': index_name}})[:-2] + b',"_id":"'
+        self.action_suffix = b'"}}\n'
+        self.fields = tuple(ES_FIELDS)
+        self.get_values = itemgetter(*ES_FIELDS.values())
+
     # Сделал для выполнения условия (- валидируйте конфигурации с помощью `pydantic`)
     def prepare_data(self, pg_data: list[models.PGDataConf]) -> list[models.ESDocument]:
         """Подготовка данных из PostgreSQL к отправки в Elasticserch.
 
         Args:
-            pg_data: Список словарей с данными из PostgreSQL.
+            pg_data: Пачка словарей с данными из PostgreSQL.
 
         Returns:
             prepared_data: Список объектов модели ESDocument.
         """
-        self.pg_data = [item for item in pg_data][0]
         prepared_data = []
-        dates = []
-        for item in self.pg_data:
+        for item in pg_data:
             entry = models.ESDocument(
                 id=item.get('id'),
                 imdb_rating=item.get('imdb_rating'),
@@ -31,53 +75,157 @@ class DataTransformer:
                 actors=item.get('actors'),
                 writers=item.get('writers'),
             )
-            update_time = item.get('modified')
             prepared_data.append(entry)
-            dates.append(update_time)
-        self.last_update_time = max(dates)
         return prepared_data
 
-    def compile_data(self, pg_data: list[models.PGDataConf]) -> list[models.ESDataConf]:
+    def map_row(self, row: models.PGDataConf) -> dict:
+        """
+        Документ Elasticsearch из строки PostgreSQL без построения модели.
+
+        Args:
+            row: Словарь с данными из PostgreSQL.
+
+        Returns:
+            document: Документ для индексации.
+        """
+        return dict(zip(self.fields, self.get_values(row)))
+
+    def check_document(self, row: models.PGDataConf, document: dict) -> bool:
+        """
+        Сверка документа с результатом строгой валидации моделью ESDocument.
+
+        Args:
+            row: Словарь с данными из PostgreSQL.
+            document: Документ, собранный map_row.
+
+        Returns:
+            bool: Документ совпадает с моделью.
+        """
+        try:
+            expected = self.prepare_data([row])[0].dict()
+        except ValidationError as er:
+            logging.warning(f'Документ {document["id"]} не прошёл валидацию ESDocument: {er}')
+            return False
+        expected['id'] = str(expected['id'])
+        if expected != document:
+            diff = sorted(field for field in expected if expected[field] != document.get(field))
+            logging.warning(f'Документ {document["id"]} расходится с ESDocument в полях: {diff}')
+            return False
+        return True
+
+    def iter_documents(self, pg_data: list[models.PGDataConf]) -> Iterator[tuple[str, bytes]]:
+        """
+        Сериализация документов пачки.
+
+        Args:
+            pg_data: Пачка словарей с данными из PostgreSQL.
+
+        Yields:
+            doc_id, document: Идентификатор и документ в JSON.
+        """
+        dumps = self.dumps
+        map_row = self.map_row
+        sample_rate = self.validate_sample_rate
+        for row in pg_data:
+            document = map_row(row)
+            if sample_rate and random.random() < sample_rate:
+                self.check_document(row, document)
+            yield document['id'], dumps(document)
+
+    def make_operation(self, doc_id: str, document: bytes) -> bytes:
+        """
+        Операция bulk index (действие + документ) в формате NDJSON.
+
+        Args:
+            doc_id: Идентификатор документа.
+            document: Документ в JSON.
+
+        Returns:
+            operation: Операция bulk.
+        """
+        return b''.join((self.action_prefix, doc_id.encode(), self.action_suffix, document, b'\n'))
+
+    def compile_data(self, pg_data: list[models.PGDataConf]) -> list[bytes]:
         """
         Подготовка bulk для загрузки в Elasticserch.
 
         Args:
-            pg_data: Список словарей с данными из PostgreSQL.
+            pg_data: Пачка словарей с данными из PostgreSQL.
+
+        Returns:
+            bulk: Список операций bulk в формате NDJSON, по одной (действие + документ) на документ.
+        """
+        bulk = [self.make_operation(doc_id, document) for doc_id, document in self.iter_documents(pg_data)]
+        metrics.DOCS_TRANSFORMED.labels('index').inc(len(bulk))
+        return bulk
+
+    def compile_changed(self, pg_data: list[models.PGDataConf]) -> tuple[list[bytes], dict[str, str]]:
+        """
+        Подготовка bulk только из документов, которые отличаются от последних загруженных.
+
+        Хэши новых документов возвращаются отдельно и сохраняются в hash_index
+        только после успешной загрузки bulk (ESLoader.push_bulk).
+
+        Args:
+            pg_data: Пачка словарей с данными из PostgreSQL.
 
         Returns:
-            bulk: Список словарей для загрузки в Elasticserch.
+            bulk: Список операций bulk в формате NDJSON.
+            hashes: Хэши документов bulk.
         """
-        entries = self.prepare_data(pg_data)
+        if self.hash_index is None:
+            return self.compile_data(pg_data), {}
+        documents = list(self.iter_documents(pg_data))
+        known = self.hash_index.get_many(doc_id for doc_id, _ in documents)
         bulk = []
-        for entry in entries:
-            index = {
-                'index': {
-                    '_index': Settings().es_index,
-                    '_id': str(entry.id),
-                },
-            }
-            document = {
-                'id': str(entry.id),
-                'imdb_rating': entry.imdb_rating,
-                'genre': entry.genre,
-                'title': entry.title,
-                'description': entry.description,
-                'director': entry.director,
-                'actors_names': entry.actors_names,
-                'writers_names': entry.writers_names,
-                'actors': entry.actors,
-                'writers': entry.writers,
-            }
-            bulk.append(json.dumps(index))
-            bulk.append(json.dumps(document))
-        bulk = '\n'.join(bulk) + '\n'
+        hashes = {}
+        for doc_id, document in documents:
+            digest = hashlib.blake2b(document, digest_size=16).hexdigest()
+            if known.get(doc_id) != digest:
+                bulk.append(self.make_operation(doc_id, document))
+                hashes[doc_id] = digest
+        metrics.DOCS_TRANSFORMED.labels('index').inc(len(bulk))
+        if len(bulk) < len(documents):
+            metrics.DOCS_SKIPPED.inc(len(documents) - len(bulk))
+            logging.info(f'Пропущено неизменившихся документов: {len(documents) - len(bulk)}')
+        return bulk, hashes
+
+    def compile_updates(self, partial_data: list[dict]) -> list[bytes]:
+        """
+        Подготовка bulk частичных обновлений (update) для изменений person | genre.
+
+        После частичного обновления сохранённый хэш документа больше не соответствует индексу,
+        поэтому хэши обновляемых документов удаляются до отправки bulk.
+
+        Args:
+            partial_data: Пачка словарей: film_work.id и поля документа.
+
+        Returns:
+            bulk: Список операций bulk update в формате NDJSON.
+        """
+        dumps = self.dumps
+        prefix, suffix = self.update_prefix, self.action_suffix
+        bulk = []
+        for row in partial_data:
+            document = {field: row[column] for field, column in ES_FIELDS.items() if field != 'id' and column in row}
+            bulk.append(b''.join((prefix, row['id'].encode(), suffix, dumps({'doc': document}), b'\n')))
+        if self.hash_index is not None:
+            self.hash_index.delete(row['id'] for row in partial_data)
+        metrics.DOCS_TRANSFORMED.labels('update').inc(len(bulk))
         return bulk
 
-    def get_last_update_time(self) -> str:
+    def compile_deletes(self, ids: list[str]) -> list[bytes]:
         """
-        Определение даты последнео изменения данных.
+        Подготовка bulk удаления документов удалённых фильмов.
+
+        Args:
+            ids: Список film_work.id.
 
         Returns:
-            last_update_time: Дата последнего изменения данных.
+            bulk: Список операций bulk delete в формате NDJSON.
         """
-        return self.last_update_time
+        prefix, suffix = self.delete_prefix, self.action_suffix
+        if self.hash_index is not None:
+            self.hash_index.delete(ids)
+        metrics.DOCS_TRANSFORMED.labels('delete').inc(len(ids))
+        return [b''.join((prefix, doc_id.encode(), suffix)) for doc_id in ids]
@@ -1,29 +1,110 @@
+import copy
 import logging
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Generator
 
-from elasticsearch import Elasticsearch, TransportError
+from elasticsearch import Elasticsearch, NotFoundError, TransportError
 
-from components import log_config, models, schema
-from components.settings import Settings
+from components import log_config, metrics, models, schema
+from components.dead_letter import DeadLetterQueue
+from components.hash_index import BaseHashIndex
+from components.settings import get_settings
 from components.state import State
 from components.utilities import backoff
 
 log_config.get_log()
 
 
+def iter_chunks(bulk: list[bytes], max_docs: int, max_bytes: int) -> Generator[list[bytes], None, None]:
+    """Разбиение bulk на чанки, ограниченные количеством документов и размером в байтах.
+
+    Args:
+        bulk: Список операций bulk в формате NDJSON.
+        max_docs: Максимальное количество документов в чанке.
+        max_bytes: Максимальный размер чанка в байтах.
+
+    Yields:
+        chunk: Список операций bulk.
+    """
+    chunk = []
+    chunk_bytes = 0
+    for operation in bulk:
+        size = len(operation)
+        if chunk and (len(chunk) >= max_docs or chunk_bytes + size > max_bytes):
+            yield chunk
+            chunk = []
+            chunk_bytes = 0
+        chunk.append(operation)
+        chunk_bytes += size
+    if chunk:
+        yield chunk
+
+
+def split_bulk_response(chunk: list[bytes], response: dict) -> tuple[list[bytes], list[tuple[bytes, dict]]]:
+    """Разбор ответа bulk по отдельным операциям.
+
+    Ошибки 429 и 5xx считаются временными, остальные (например, ошибки маппинга) - постоянными.
+    Частичное обновление (update) отсутствующего документа не считается ошибкой: документ
+    будет загружен целиком при обработке самого фильма.
+
+    Args:
+        chunk: Отправленные операции bulk, в том же порядке, что и items ответа.
+        response: Ответ Elasticsearch на bulk-запрос.
+
+    Returns:
+        retry: Операции, которые нужно отправить повторно.
+        rejected: Операции с постоянной ошибкой и ответ Elasticsearch для каждой.
+    """
+    retry = []
+    rejected = []
+    if not response['errors']:
+        return retry, rejected
+    for operation, result in zip(chunk, response['items']):
+        action, item = next(iter(result.items()))
+        status = item.get('status', 500)
+        if status < 300 or 'error' not in item or (action == 'update' and status == 404):
+            continue
+        if status == 429 or status >= 500:
+            retry.append(operation)
+        else:
+            rejected.append((operation, item))
+    return retry, rejected
+
+
 class ESLoader:
-    def __init__(self, dsl: str, index_name: str, state_maneger: State):
+    def __init__(
+        self,
+        dsl: str,
+        index_name: str,
+        state_maneger: State | None = None,
+        hash_index: BaseHashIndex | None = None,
+    ):
         """
         Args:
             dsl: Клиент для связи с сервером Elasticsearch.
             index_name: Индекс.
-            state_maneger: Объект класса State для хранения состояний.
+            state_maneger: Объект класса State для хранения состояний; не нужен, если отметки не сохраняются.
+            hash_index: Хэши загруженных документов, обновляются после успешной загрузки пачки.
         """
+        settings = get_settings()
         self.dsl = dsl
         self.index_name = index_name
         self.state_maneger = state_maneger
+        self.hash_index = hash_index
+        self.max_docs = settings.bulk_max_docs
+        self.max_bytes = settings.bulk_max_bytes
+        self.refresh_threshold = settings.bulk_refresh_threshold
+        self.executor = ThreadPoolExecutor(max_workers=settings.bulk_concurrency)
+        self.item_retries = settings.bulk_item_retries
+        self.dead_letter = DeadLetterQueue(settings.dead_letter_file)
+        self.loaded_docs = 0
+        self.saved_refresh_interval = None
         self.connection = self.get_connection()
 
-    @backoff(logger=log_config.get_log)
+    @backoff(logger=log_config.get_log, dependency='elasticsearch')
     def get_connection(self) -> Elasticsearch:
         """ Реализация отказоустойчивости.
 
@@ -32,31 +113,279 @@ class ESLoader:
         """
         return Elasticsearch(self.dsl)
 
-    @backoff(logger=log_config.get_log)
+    def close(self) -> None:
+        """Закрытие соединения с Elasticsearch."""
+        self.executor.shutdown()
+        self.connection.close()
+
+    @backoff(logger=log_config.get_log, dependency='elasticsearch')
     def check_connection(self) -> None:
         """Проверка связи с сервером Elasticsearch."""
         if not self.connection.ping():
             logging.error('Нет связи с сервером Elasticsearch')
             raise TransportError('Нет связи с сервером Elasticsearch')
 
-    @backoff(logger=log_config.get_log)
-    def push_index(self) -> None:
-        """Отправка индекса в Elasticsearch."""
-        body = schema.ES_SCHEMA
+    @backoff(logger=log_config.get_log, dependency='elasticsearch')
+    def push_index(self, index_name: str | None = None, index_settings: dict | None = None) -> None:
+        """Отправка индекса в Elasticsearch.
+
+        Args:
+            index_name: Имя индекса, по умолчанию self.index_name.
+            index_settings: Настройки, заменяющие настройки из ES_SCHEMA.
+        """
+        body = copy.deepcopy(schema.ES_SCHEMA)
+        body['settings'].update(index_settings or {})
         self.check_connection()
-        self.connection.indices.create(index=self.index_name, body=body)
+        self.connection.indices.create(index=index_name or self.index_name, body=body)
+
+    @backoff(logger=log_config.get_log, dependency='elasticsearch')
+    def get_alias_indices(self, alias: str) -> list[str]:
+        """Индексы, на которые указывает алиас.
+
+        Args:
+            alias: Алиас.
+
+        Returns:
+            indices: Список индексов | пустой список, если алиаса нет.
+        """
+        try:
+            return list(self.connection.indices.get_alias(name=alias))
+        except NotFoundError:
+            return []
+
+    @backoff(logger=log_config.get_log, dependency='elasticsearch')
+    def get_next_version_index(self, alias: str) -> str:
+        """Имя следующей версии индекса вида {alias}_v{n}.
+
+        Args:
+            alias: Алиас.
+
+        Returns:
+            index_name: Имя индекса.
+        """
+        versions = [
+            int(match.group(1))
+            for index_name in self.connection.indices.get(index=f'{alias}_v*')
+            if (match := re.fullmatch(rf'{re.escape(alias)}_v(\d+)', index_name))
+        ]
+        return f'{alias}_v{max(versions, default=0) + 1}'
+
+    @backoff(logger=log_config.get_log, dependency='elasticsearch')
+    def create_alias_index(self, alias: str) -> str:
+        """Создание первой версии индекса и алиаса на неё.
+
+        Args:
+            alias: Алиас.
+
+        Returns:
+            index_name: Имя созданного индекса.
+        """
+        index_name = self.get_next_version_index(alias)
+        self.push_index(index_name)
+        self.connection.indices.put_alias(index=index_name, name=alias)
+        return index_name
+
+    @backoff(logger=log_config.get_log, dependency='elasticsearch')
+    def get_index_settings(self, index_name: str) -> dict:
+        """Настройки индекса.
+
+        Args:
+            index_name: Имя индекса | алиас.
+
+        Returns:
+            settings: Настройки index.* первого найденного индекса.
+        """
+        response = self.connection.indices.get_settings(index=index_name)
+        return next(iter(response.values()))['settings']['index']
+
+    @backoff(logger=log_config.get_log, dependency='elasticsearch')
+    def put_index_settings(self, index_name: str, index_settings: dict) -> None:
+        """Изменение динамических настроек индекса.
+
+        Args:
+            index_name: Имя индекса.
+            index_settings: Настройки.
+        """
+        self.connection.indices.put_settings(index=index_name, settings=index_settings)
+
+    @backoff(logger=log_config.get_log, dependency='elasticsearch')
+    def forcemerge(self, index_name: str) -> None:
+        """Слияние сегментов индекса в один после загрузки.
+
+        Args:
+            index_name: Имя индекса.
+        """
+        self.connection.options(request_timeout=3600).indices.forcemerge(index=index_name, max_num_segments=1)
+        self.connection.indices.refresh(index=index_name)
+
+    @backoff(logger=log_config.get_log, dependency='elasticsearch')
+    def swap_alias(self, alias: str, index_name: str) -> list[str]:
+        """Атомарное переключение алиаса на новый индекс.
+
+        Если под именем алиаса существует обычный индекс (до перехода на алиасы),
+        он удаляется в том же запросе.
+
+        Args:
+            alias: Алиас.
+            index_name: Новый индекс.
+
+        Returns:
+            old_indices: Индексы, на которые алиас указывал раньше.
+        """
+        old_indices = self.get_alias_indices(alias)
+        actions = [{'remove': {'index': old_index, 'alias': alias}} for old_index in old_indices]
+        if not old_indices and self.connection.indices.exists(index=alias):
+            actions.append({'remove_index': {'index': alias}})
+        actions.append({'add': {'index': index_name, 'alias': alias}})
+        self.connection.indices.update_aliases(actions=actions)
+        return old_indices
+
+    @backoff(logger=log_config.get_log, dependency='elasticsearch')
+    def post_bulk(self, chunk: list[bytes]) -> dict:
+        """
+        Bulk-запрос в Elasticsearch; при ошибке соединения повторяется тот же набор операций.
 
-    @backoff(logger=log_config.get_log)
-    def push_bulk(self, bulk: list[models.ESDataConf], last_update_time: str) -> None:
+        Args:
+            chunk: Список операций bulk.
+
+        Returns:
+            response: Ответ Elasticsearch.
+        """
+        return self.connection.bulk(operations=b''.join(chunk), index=self.index_name)
+
+    def send_chunk(self, chunk: list[bytes]) -> list[str]:
+        """
+        Отправка одного чанка bulk в Elasticsearch с обработкой ошибок по каждой операции.
+
+        Операции с временными ошибками отправляются повторно (только они),
+        операции с постоянными ошибками сохраняются в очередь недоставленных.
+
+        Args:
+            chunk: Список операций bulk.
+
+        Returns:
+            rejected_ids: Идентификаторы документов, сохранённых в очередь недоставленных.
+
+        Raises:
+            RuntimeError: Временные ошибки не устранились за ES_BULK_ITEM_RETRIES повторов.
+        """
+        started = time.perf_counter()
+        pending = chunk
+        rejected_ids = []
+        for attempt in range(self.item_retries + 1):
+            if attempt:
+                logging.warning(f'Повтор {len(pending)} операций bulk, попытка {attempt}')
+                time.sleep(min(0.5 * 2 ** attempt, 30))
+            pending, rejected = split_bulk_response(pending, self.post_bulk(pending))
+            for operation, item in rejected:
+                self.dead_letter.put(operation, item)
+                rejected_ids.append(item.get('_id'))
+            if not pending:
+                break
+        else:
+            raise RuntimeError(f'Elasticsearch не принял {len(pending)} операций bulk')
+        latency = time.perf_counter() - started
+        chunk_bytes = sum(len(operation) for operation in chunk)
+        metrics.BULK_LATENCY.observe(latency)
+        metrics.BULK_DOCS.inc(len(chunk))
+        metrics.BULK_BYTES.inc(chunk_bytes)
+        metrics.BULK_REJECTED.inc(len(rejected_ids))
+        logging.info(
+            f'Чанк загружен: {len(chunk)} док., {chunk_bytes} байт, '
+            f'{latency:.3f} с, {len(chunk) / max(latency, 1e-6):.0f} док./с',
+        )
+        return rejected_ids
+
+    def push_bulk(
+        self,
+        bulk: list[bytes],
+        watermarks: dict[str, models.Watermark] | None = None,
+        hashes: dict[str, str] | None = None,
+    ) -> None:
         """
         Отправка пачки данных в Elasticsearch.
 
+        Пачка делится на чанки по ES_BULK_MAX_DOCS документов и ES_BULK_MAX_BYTES байт,
+        чанки отправляются параллельно в ES_BULK_CONCURRENCY потоков. Отметки сохраняются,
+        когда каждая операция пачки либо принята, либо сохранена в очередь недоставленных. Когда за одну загрузку
+        отправлено больше ES_BULK_REFRESH_THRESHOLD документов, refresh индекса отключается
+        до вызова finish_load().
+
         Args:
-            bulk: Список словарей для загрузки в Elasticserch.
-            last_update_time: Время последнего обновления данных.
+            bulk: Список операций bulk в формате NDJSON.
+            watermarks: Отметки таблиц, которые сохраняются после успешной загрузки пачки.
+            hashes: Хэши документов пачки, сохраняются в hash_index для принятых Elasticsearch документов.
         """
-        self.check_connection()
-        self.connection.bulk(operations=bulk, index=self.index_name)
-        logging.info('Данные успешно обновлены')
-        self.state_maneger.set_state(key=Settings().state_key, value=last_update_time)
-        logging.info(f'Дата последнего обновления данных: {last_update_time}')
+        if bulk:
+            self.check_connection()
+            started = time.perf_counter()
+            futures = [
+                self.executor.submit(self.send_chunk, chunk)
+                for chunk in iter_chunks(bulk, self.max_docs, self.max_bytes)
+            ]
+            rejected_ids = set()
+            for future in futures:
+                rejected_ids.update(future.result())
+            if hashes and self.hash_index is not None:
+                self.hash_index.update({
+                    doc_id: digest for doc_id, digest in hashes.items() if doc_id not in rejected_ids
+                })
+            latency = time.perf_counter() - started
+            logging.info(f'Данные успешно обновлены: {len(bulk)} док., {len(bulk) / max(latency, 1e-6):.0f} док./с')
+            self.loaded_docs += len(bulk)
+            if self.loaded_docs >= self.refresh_threshold and self.saved_refresh_interval is None:
+                self.saved_refresh_interval = self.disable_refresh(self.index_name)
+        if watermarks:
+            self.state_maneger.commit(watermarks)
+            for table, watermark in watermarks.items():
+                logging.info(f'Последнее обновление данных ({table}): {watermark.modified}, {watermark.id}')
+
+    def finish_load(self) -> None:
+        """Завершение загрузки: восстановление refresh_interval, если он был отключен."""
+        if self.saved_refresh_interval is not None:
+            self.put_index_settings(self.index_name, {'refresh_interval': self.saved_refresh_interval})
+            logging.info(f'refresh_interval индекса {self.index_name} восстановлен')
+        self.saved_refresh_interval = None
+        self.loaded_docs = 0
+
+    def disable_refresh(self, index_name: str) -> str:
+        """Отключение refresh на время большой загрузки.
+
+        Args:
+            index_name: Индекс | алиас.
+
+        Returns:
+            refresh_interval: Прежнее значение refresh_interval.
+        """
+        refresh_interval = self.get_index_settings(index_name).get(
+            'refresh_interval', schema.ES_SCHEMA['settings']['refresh_interval'],
+        )
+        self.put_index_settings(index_name, {'refresh_interval': '-1'})
+        logging.info(f'refresh_interval индекса {index_name} отключен на время загрузки')
+        return refresh_interval
+
+    @contextmanager
+    def refresh_disabled(self, index_name: str) -> Generator[None, None, None]:
+        """Контекстный менеджер: refresh отключен внутри блока и восстанавливается после.
+
+        Args:
+            index_name: Индекс | алиас.
+
+        Yields:
+            None
+        """
+        refresh_interval = self.disable_refresh(index_name)
+        try:
+            yield
+        finally:
+            self.put_index_settings(index_name, {'refresh_interval': refresh_interval})
+
+    def restore_refresh(self, index_name: str) -> None:
+        """Восстановление refresh_interval из ES_SCHEMA, если он остался отключенным после сбоя.
+
+        Args:
+            index_name: Индекс | алиас.
+        """
+        if self.get_index_settings(index_name).get('refresh_interval') == '-1':
+            self.put_index_settings(index_name, {'refresh_interval': schema.ES_SCHEMA['settings']['refresh_interval']})
+            logging.warning(f'refresh_interval индекса {index_name} был отключен и восстановлен')
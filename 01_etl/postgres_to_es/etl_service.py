@@ -0,0 +1,239 @@
+import logging
+import signal
+import threading
+import time
+from typing import Iterator
+
+from components import hash_index, log_config, metrics, models, sql_queries, state
+from components.leases import LeaseLostError, LeaseManager
+from components.pg_listener import PGListener
+from components.pg_pool import PGConnectionPool
+from components.settings import Settings
+from components.utilities import CircuitOpenError, RetryBudgetExceeded
+from data_transform import DataTransformer
+from elastic_loader import ESLoader
+from pg_extractor import PostgresExtractor
+
+log_config.get_log()
+
+
+class ETLService:
+    """Долгоживущий сервис переноса данных из PostgreSQL в Elasticsearch.
+
+    Все компоненты создаются один раз при запуске и переиспользуются во всех итерациях.
+    """
+
+    def __init__(self, settings: Settings) -> None:
+        """
+        Args:
+            settings: Настройки ETL.
+        """
+        self.settings = settings
+        self.stop_event = threading.Event()
+        self.leases = None
+        if settings.state_backend == 'redis':
+            # Несколько реплик делят таблицы-источники через аренду в Redis.
+            storage = state.RedisStorage()
+            self.leases = LeaseManager(storage.connection, storage.key, settings.lease_ttl)
+        else:
+            storage = state.JsonFileStorage(
+                settings.state_file,
+                flush_every=settings.state_flush_every,
+                flush_interval=settings.state_flush_interval,
+            )
+        self.state_maneger = state.State(storage, self.leases)
+        self.hash_index = None
+        if settings.skip_unchanged and settings.state_backend == 'redis':
+            # Хэши хранятся там же, где состояние: у реплик ETL общий индекс хэшей.
+            self.hash_index = hash_index.RedisHashIndex(settings.dsl_redis, settings.hash_index_key)
+        elif settings.skip_unchanged:
+            self.hash_index = hash_index.JsonFileHashIndex(settings.hash_index_file)
+        self.pg_pool = PGConnectionPool(
+            dsl=settings.dsl_pg,
+            minconn=settings.pg_pool_minconn,
+            maxconn=settings.pg_pool_maxconn,
+            health_check_interval=settings.pg_health_check_interval,
+        )
+        self.extractor = PostgresExtractor(
+            pool=self.pg_pool,
+            state_maneger=self.state_maneger,
+            batch_size=settings.batch_size,
+            partial_update=settings.partial_update,
+            change_overlap=settings.change_overlap,
+        )
+        self.transformer = DataTransformer(
+            settings.es_index,
+            settings.json_backend,
+            settings.validate_sample_rate,
+            self.hash_index,
+        )
+        self.loader = ESLoader(settings.es_url, settings.es_index, self.state_maneger, self.hash_index)
+        self.listener = PGListener(settings.dsl_pg, sql_queries.NOTIFY_CHANNEL) if settings.use_notify else None
+
+    def check_es_index(self) -> None:
+        """Проверка наличия | создание индекса {es_index}_v1 с алиасом es_index в Elasticsearch."""
+        if not self.loader.connection.indices.exists(index=self.settings.es_index):
+            logging.warning('Отсутствеут индекс в Elasticsearch')
+            index_name = self.loader.create_alias_index(self.settings.es_index)
+            logging.info(f'Создан новый индекс в Elasticsearch: {index_name}')
+            if self.hash_index is not None:
+                self.hash_index.clear()
+        else:
+            self.loader.restore_refresh(self.settings.es_index)
+
+    def claim_work(self, film_work_ids: set[str] | None) -> set[str]:
+        """Выбор таблиц, которые обрабатывает этот процесс, перед итерацией.
+
+        С арендой в Redis процесс обрабатывает только арендованные таблицы (не больше справедливой
+        доли на реплику, см. LeaseManager) и начинает с отметок, сохранённых в хранилище
+        (их могли сдвинуть другие реплики).
+        Фильмы из уведомлений загружает владелец аренды film_work.
+
+        Args:
+            film_work_ids: Фильмы из уведомлений об изменении связей.
+
+        Returns:
+            film_work_ids: Фильмы из уведомлений, которые загружает этот процесс.
+        """
+        if self.leases is None:
+            return film_work_ids or set()
+        tables = self.leases.acquire_many([*self.settings.pg_models, sql_queries.DELETED_TABLE])
+        self.extractor.tables = tables
+        self.state_maneger.refresh()
+        return (film_work_ids or set()) if 'film_work' in tables else set()
+
+    def run_once(self, film_work_ids: set[str] | None = None) -> bool:
+        """Одна итерация переноса всех накопившихся изменений.
+
+        Args:
+            film_work_ids: Фильмы из уведомлений об изменении связей, загружаемые вне отметок таблиц.
+
+        Returns:
+            bool: Продвинулась ли отметка хотя бы одной таблицы. Повторно прочитанные в окне change_overlap
+                изменения отметки не продвигают, поэтому после них цикл ждёт новых изменений.
+        """
+        film_work_ids = self.claim_work(film_work_ids)
+        is_updated = False
+        try:
+            if film_work_ids:
+                by_ids = self.extractor.get_data_by_ids(film_work_ids)
+                for pg_data, watermarks in metrics.timed_iter(by_ids, 'extract'):
+                    with metrics.STAGE_SECONDS.labels('transform').time():
+                        bulk, hashes = self.transformer.compile_changed(pg_data=pg_data)
+                    self.load(bulk, watermarks, hashes)
+            for pg_data, watermarks in metrics.timed_iter(self.extractor.get_data(), 'extract'):
+                with metrics.STAGE_SECONDS.labels('transform').time():
+                    bulk, hashes = self.transformer.compile_changed(pg_data=pg_data)
+                is_updated |= self.load(bulk, watermarks, hashes)
+                if self.stop_event.is_set():
+                    break
+            for partial_data, watermarks in metrics.timed_iter(self.extractor.get_partial_data(), 'extract'):
+                if self.stop_event.is_set():
+                    break
+                with metrics.STAGE_SECONDS.labels('transform').time():
+                    bulk = self.transformer.compile_updates(partial_data)
+                is_updated |= self.load(bulk, watermarks)
+            for ids, watermarks in metrics.timed_iter(self.get_deleted(), 'extract'):
+                if self.stop_event.is_set():
+                    break
+                is_updated |= self.load(self.transformer.compile_deletes(ids), watermarks)
+        finally:
+            self.loader.finish_load()
+            self.state_maneger.flush()
+        return is_updated
+
+    def load(
+        self,
+        bulk: list[bytes],
+        watermarks: dict[str, models.Watermark],
+        hashes: dict[str, str] | None = None,
+    ) -> bool:
+        """Загрузка пачки в Elasticsearch с учётом времени этапа load.
+
+        Args:
+            bulk: Список операций bulk в формате NDJSON.
+            watermarks: Отметки таблиц, которые сохраняются после успешной загрузки пачки.
+            hashes: Хэши документов пачки.
+
+        Returns:
+            bool: Пачка продвинула отметку хотя бы одной таблицы.
+        """
+        advanced = self.state_maneger.advances(watermarks)
+        with metrics.STAGE_SECONDS.labels('load').time():
+            self.loader.push_bulk(bulk=bulk, watermarks=watermarks, hashes=hashes)
+        return advanced
+
+    def get_deleted(self) -> Iterator[tuple[list[str], dict[str, models.Watermark]]]:
+        """Удалённые фильмы из журнала удалений, если распространение удалений включено.
+
+        Returns:
+            Iterator: Пачки film_work.id и отметки журнала удалений.
+        """
+        if not self.settings.propagate_deletes:
+            return iter(())
+        return self.extractor.get_deleted()
+
+    def wait_for_changes(self) -> set[str]:
+        """Ожидание изменений в PostgreSQL.
+
+        Без LISTEN/NOTIFY - пауза time_to_sleep. С LISTEN/NOTIFY - ожидание уведомления,
+        но не дольше notify_poll_interval, после чего выполняется контрольный опрос
+        на случай пропущенных уведомлений.
+
+        Returns:
+            film_work_ids: Фильмы из уведомлений об изменении связей.
+        """
+        if self.listener is None:
+            self.stop_event.wait(self.settings.time_to_sleep)
+            return set()
+        deadline = time.monotonic() + self.settings.notify_poll_interval
+        while not self.stop_event.is_set() and (timeout := deadline - time.monotonic()) > 0:
+            film_work_ids = self.listener.wait(min(timeout, 1))
+            if film_work_ids is not None:
+                return film_work_ids
+        return set()
+
+    def run(self) -> None:
+        """Основной цикл работы до получения сигнала остановки."""
+        metrics.start_server(self.settings.metrics_port, self.state_maneger)
+        self.check_es_index()
+        if self.listener is not None:
+            self.listener.listen()
+        if self.leases is not None:
+            self.leases.start()
+        film_work_ids = set()
+        try:
+            while not self.stop_event.is_set():
+                try:
+                    is_updated = self.run_once(film_work_ids)
+                except (CircuitOpenError, RetryBudgetExceeded) as er:
+                    # Зависимость недоступна: итерация повторяется после паузы, а не сразу.
+                    logging.error(f'Итерация ETL прервана: {er}')
+                    self.stop_event.wait(self.settings.breaker_reset_timeout)
+                    continue
+                except LeaseLostError as er:
+                    # Таблицу обрабатывает другая реплика, её изменения загрузит она.
+                    logging.warning(f'Итерация ETL прервана: {er}')
+                    continue
+                film_work_ids = set() if is_updated else self.wait_for_changes()
+        finally:
+            self.close()
+
+    def stop(self, signum: int, frame=None) -> None:
+        """Обработчик сигнала остановки: текущая пачка дозагружается, затем цикл завершается.
+
+        Args:
+            signum: Номер сигнала.
+            frame: Текущий стек вызова.
+        """
+        logging.info(f'Получен сигнал {signal.Signals(signum).name}, остановка ETL')
+        self.stop_event.set()
+
+    def close(self) -> None:
+        """Освобождение соединений с PostgreSQL и Elasticsearch."""
+        self.pg_pool.close()
+        self.loader.close()
+        if self.listener is not None:
+            self.listener.close()
+        if self.leases is not None:
+            self.leases.stop()
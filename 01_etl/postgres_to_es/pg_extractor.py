@@ -1,14 +1,11 @@
-import datetime
-import logging
-from contextlib import contextmanager
-from typing import Generator
+from datetime import datetime, timedelta, timezone
+from typing import ContextManager, Generator, Iterator
 
-import psycopg2
 from psycopg2.extensions import connection as _connection
-from psycopg2.extras import DictCursor
 
-from components import log_config, models, sql_queries
-from components.settings import Settings
+from components import log_config, metrics, models, sql_queries
+from components.pg_pool import PGConnectionPool
+from components.settings import get_settings
 from components.state import State
 from components.utilities import backoff
 
@@ -18,95 +15,293 @@ log_config.get_log()
 class PostgresExtractor:
     def __init__(
             self,
-            dsl: models.DBConf,
+            pool: PGConnectionPool,
             state_maneger: State,
             batch_size: int = 100,
-            cursor_factory=DictCursor) -> None:
+            partial_update: bool = False,
+            change_overlap: float = 0) -> None:
         """
         Args:
-            dsl: Данные для подключения к psql.
-            cursor_factory: Курсор.
+            pool: Пул соединений с psql, общий для всех итераций ETL.
             state_maneger: Объект класса State для хранения состояний.
             batch_size: Количество данных, передоваемых из psql.
+            partial_update: Изменения person и genre отдаются get_partial_data, а не get_data.
+            change_overlap: Окно повторного чтения позади отметки, секунд (0 - без повторного чтения).
         """
-        self.dsl = dsl
-        self.cursor_factory = cursor_factory
+        self.pool = pool
         self.state_maneger = state_maneger
         self.batch_size = batch_size
+        self.partial_update = partial_update
+        self.change_overlap = change_overlap
+        # Таблицы, которые обрабатывает этот процесс (аренда при нескольких репликах); None - все.
+        self.tables = None
 
-    @backoff(logger=log_config.get_log)
-    def get_connection(self) -> _connection:
+    def owns(self, table: str) -> bool:
         """
-        Реализация отказоустойчивости.
+        Обрабатывает ли этот процесс изменения таблицы.
+
+        Args:
+            table: Имя таблицы.
 
         Returns:
-            _connection: Конектор.
+            bool: Таблица принадлежит процессу.
         """
-        return psycopg2.connect(**self.dsl, cursor_factory=self.cursor_factory)
+        return self.tables is None or table in self.tables
 
-    @contextmanager
-    def get_pg_conn(self) -> _connection:
+    def get_pg_conn(self) -> ContextManager[_connection]:
         """
         Контекстный менеджер для psql.
 
-        Yields:
-            _connection: Конектор.
+        Returns:
+            ContextManager: Соединение из пула.
         """
-        conn = self.get_connection()
-        yield conn
-        conn.close()
+        return self.pool.connection()
 
-    def get_last_update_time(self) -> datetime:
+    def get_scan_start(self, watermark: models.Watermark) -> tuple[str, str]:
         """
-        Получение времени последнего обновления данных.
+        Позиция, с которой читаются изменения таблицы.
+
+        modified проставляется до фиксации транзакции, поэтому транзакция, зафиксированная
+        после более поздней, может оказаться позади отметки. Пока отметка моложе change_overlap секунд,
+        изменения перечитываются с позиции на change_overlap секунд раньше: повторно прочитанные
+        фильмы с неизменённым документом отсекает индекс хэшей, отметка при этом не отступает.
+        Частичные обновления и удаления не сверяются с индексом хэшей, поэтому их страницы, целиком
+        лежащие позади сохранённой отметки, не отправляются повторно (skip_reread в get_changed_ids).
+
+        Args:
+            watermark: Сохранённая отметка таблицы.
 
         Returns:
-            last_check: Дата последнего обновления данных.
+            tuple: (modified, id) начала чтения.
         """
-        try:
-            last_check = self.state_maneger.get_state(Settings().state_key)
-            return datetime.datetime.strptime(last_check[:-3], '%Y-%m-%d %H:%M:%S.%f')
+        if not self.change_overlap:
+            return watermark.modified, watermark.id
+        modified = watermark.key()[0]
+        start = max(modified, datetime.now(timezone.utc)) - timedelta(seconds=self.change_overlap)
+        if start >= modified:
+            return watermark.modified, watermark.id
+        return start.isoformat(), sql_queries.MIN_UUID
 
-        except (TypeError, ValueError):
-            logging.warning('Отсутсвует файл с данными о последнем состоянии')
-            last_check = '2021-01-01 00:0:00.000001'
-            self.state_maneger.set_state(key=Settings().state_key, value=last_check)
-            return datetime.datetime.strptime(last_check, '%Y-%m-%d %H:%M:%S.%f')
+    def get_changed_ids(
+        self,
+        table: str,
+        skip_reread: bool = False,
+    ) -> Generator[tuple[list[str], dict[str, models.Watermark]], None, None]:
+        """
+        Получение из PostgreSQL id изменившихся записей таблицы.
 
-    def get_id(self) -> set:
+        Записи читаются страницами по batch_size строк с keyset-пагинацией
+        по (modified, id), начиная с отметки из State (с учётом окна change_overlap).
+
+        Args:
+            table: Имя таблицы из Settings().pg_models.
+            skip_reread: Не отдавать страницы окна change_overlap, отметка которых не дальше сохранённой.
+
+        Yields:
+            ids: Список id записей таблицы для страницы.
+            watermarks: Отметка таблицы, которую нужно сохранить после загрузки страницы.
         """
-        Получение из PostgreSQL всех id для таблицы filmwork в которых были внесены изменения.
+        stored = self.state_maneger.get_watermark(table)
+        last_modified, last_id = self.get_scan_start(stored)
+        query = sql_queries.get_changes_query(table)
+        while True:
+            with self.get_pg_conn() as connection, connection.cursor() as cursor:
+                cursor.execute(query, (last_modified, last_id, self.batch_size))
+                rows = cursor.fetchall()
+            if not rows:
+                break
+            last_modified, last_id = str(rows[-1]['modified']), str(rows[-1]['id'])
+            watermark = models.Watermark(modified=last_modified, id=last_id)
+            if skip_reread and watermark.key() <= stored.key():
+                continue
+            yield [str(row['id']) for row in rows], {table: watermark}
 
-        Returns:
-            result: Множество всех id для таблицы filmwork в которых были внесены изменения.
+    def get_id(self, table: str) -> Generator[tuple[list[str], dict[str, models.Watermark]], None, None]:
         """
-        ids = []
+        Получение из PostgreSQL id фильмов, затронутых изменениями в таблице.
 
-        for query in sql_queries.get_query(self.get_last_update_time()):
-            with self.get_pg_conn() as connection, connection.cursor() as cursor:
-                cursor.execute(query)
-                pg_data = cursor.fetchmany(self.batch_size)
-                ids.append((str(item[0]) for item in pg_data))
-        result = set(ids[0])
-        return result
+        Изменившиеся записи таблицы отображаются на film_work.id через person_film_work | genre_film_work.
 
-    @backoff(logger=log_config.get_log)
-    def get_data(self) -> Generator[list[models.PGDataConf], None, None]:
+        Args:
+            table: Имя таблицы из Settings().pg_models.
+
+        Yields:
+            ids: Список уникальных film_work.id для страницы.
+            watermarks: Отметка таблицы, которую нужно сохранить после загрузки страницы.
         """
-        Получение данных из PostgreSQL.
+        for ids, watermarks in self.get_changed_ids(table):
+            if table in sql_queries.RELATED_FILM_WORK_QUERY:
+                with self.get_pg_conn() as connection, connection.cursor() as cursor:
+                    cursor.execute(sql_queries.RELATED_FILM_WORK_QUERY[table], (ids,))
+                    ids = [str(row[0]) for row in cursor.fetchall()]
+            yield ids, watermarks
+
+    def get_documents(self, ids: list[str]) -> Generator[list[models.PGDataConf], None, None]:
+        """
+        Получение документов фильмов из PostgreSQL.
+
+        Данные читаются через именованный (серверный) курсор пачками по batch_size строк,
+        поэтому потребление памяти не зависит от количества фильмов.
+
+        Args:
+            ids: Список film_work.id.
 
         Yields:
             Generator: Список словарей с данными из PostgreSQL.
         """
-        try:
-            ids = [id for id in self.get_id()]
-            ids_count = ', '.join('%s' for _ in range(len(ids)))
+        if not ids:
+            return
+        with self.get_pg_conn() as connection, connection.cursor(name='etl_film_work') as cursor:
+            cursor.execute(sql_queries.SQL_QUERY, (ids,))
+            while rows := cursor.fetchmany(self.batch_size):
+                metrics.ROWS_EXTRACTED.labels('document').inc(len(rows))
+                yield [dict(row) for row in rows]
+
+    def get_partial_documents(self, table: str, ids: list[str]) -> Generator[list[dict], None, None]:
+        """
+        Получение полей документов, зависящих от изменившихся записей person | genre.
+
+        Args:
+            table: 'person' | 'genre'.
+            ids: Список id изменившихся записей таблицы.
+
+        Yields:
+            Generator: Список словарей: film_work.id и поля документа.
+        """
+        if not ids:
+            return
+        with self.get_pg_conn() as connection, connection.cursor(name=f'etl_partial_{table}') as cursor:
+            cursor.execute(sql_queries.PARTIAL_UPDATE_QUERY[table], (ids,))
+            while rows := cursor.fetchmany(self.batch_size):
+                metrics.ROWS_EXTRACTED.labels(f'partial_{table}').inc(len(rows))
+                yield [dict(row) for row in rows]
+
+    @staticmethod
+    def with_watermarks(
+        batches: Iterator[list[dict]],
+        watermarks: dict[str, models.Watermark],
+    ) -> Generator[tuple[list[dict], dict[str, models.Watermark]], None, None]:
+        """
+        Отметки страницы изменений передаются только вместе с её последней пачкой,
+        чтобы после сбоя необработанная часть страницы была загружена заново.
+
+        Args:
+            batches: Пачки страницы изменений.
+            watermarks: Отметки страницы.
+
+        Yields:
+            batch: Пачка.
+            watermarks: Отметки для сохранения после загрузки пачки.
+        """
+        batch = next(batches, [])
+        for next_batch in batches:
+            yield batch, {}
+            batch = next_batch
+        yield batch, watermarks
+
+    @backoff(logger=log_config.get_log, dependency='postgres')
+    def get_data(self) -> Generator[tuple[list[models.PGDataConf], dict[str, models.Watermark]], None, None]:
+        """
+        Получение данных из PostgreSQL.
+
+        Отметка таблицы отдаётся только вместе с последней пачкой страницы изменений,
+        чтобы после сбоя необработанная часть страницы была загружена заново.
+        В режиме partial_update изменения person и genre сюда не входят.
+
+        Yields:
+            pg_data: Список словарей с данными из PostgreSQL.
+            watermarks: Отметки таблиц для сохранения после загрузки пачки.
+        """
+        for table in get_settings().pg_models:
+            if not self.owns(table) or (self.partial_update and table in sql_queries.PARTIAL_UPDATE_QUERY):
+                continue
+            for ids, watermarks in self.get_id(table):
+                yield from self.with_watermarks(self.get_documents(ids), watermarks)
+
+    @backoff(logger=log_config.get_log, dependency='postgres')
+    def get_partial_data(self) -> Generator[tuple[list[dict], dict[str, models.Watermark]], None, None]:
+        """
+        Получение из PostgreSQL частичных документов для изменений person и genre.
+
+        Для каждого затронутого фильма читаются только поля, которые зависят от изменившейся таблицы
+        (участники | жанры) из content.film_work_document, без чтения content.film_work.
+
+        Yields:
+            partial_data: Список словарей: film_work.id и поля документа.
+            watermarks: Отметки таблиц для сохранения после загрузки пачки.
+        """
+        if not self.partial_update:
+            return
+        for table in get_settings().pg_models:
+            if not self.owns(table) or table not in sql_queries.PARTIAL_UPDATE_QUERY:
+                continue
+            for ids, watermarks in self.get_changed_ids(table, skip_reread=True):
+                yield from self.with_watermarks(self.get_partial_documents(table, ids), watermarks)
+
+    @backoff(logger=log_config.get_log, dependency='postgres')
+    def get_deleted(self) -> Generator[tuple[list[str], dict[str, models.Watermark]], None, None]:
+        """
+        Получение из журнала content.film_work_deleted id удалённых фильмов.
+
+        Журнал читается с keyset-пагинацией по (modified, id), как таблицы-источники, с тем же окном
+        повторного чтения change_overlap: modified журнала - now() транзакции удаления, а не время фиксации.
+        Страницы окна, целиком лежащие позади сохранённой отметки, не отправляются повторно;
+        повторное удаление из страницы на границе отметки Elasticsearch пропускает (404 в ответе bulk не ошибка).
+
+        Yields:
+            ids: Список film_work.id, которые нужно удалить из индекса.
+            watermarks: Отметка журнала удалений для сохранения после загрузки пачки.
+        """
+        if not self.owns(sql_queries.DELETED_TABLE):
+            return
+        for ids, watermarks in self.get_changed_ids(sql_queries.DELETED_TABLE, skip_reread=True):
+            with self.get_pg_conn() as connection, connection.cursor() as cursor:
+                cursor.execute(sql_queries.DELETED_FILM_WORK_QUERY, (ids,))
+                rows = cursor.fetchall()
+            metrics.ROWS_EXTRACTED.labels('deleted').inc(len(rows))
+            yield [row[0] for row in rows], watermarks
+
+    def get_data_by_ids(
+        self,
+        ids: set[str],
+    ) -> Generator[tuple[list[models.PGDataConf], dict[str, models.Watermark]], None, None]:
+        """
+        Получение данных из PostgreSQL для заданных фильмов, без изменения отметок таблиц.
+
+        Args:
+            ids: Множество film_work.id.
+
+        Yields:
+            pg_data: Список словарей с данными из PostgreSQL.
+            watermarks: Пустой словарь отметок.
+        """
+        for batch in self.get_documents(list(ids)):
+            yield batch, {}
+
+    def get_shard_data(
+        self,
+        last_id: str,
+        max_id: str,
+    ) -> Generator[tuple[list[models.PGDataConf], dict[str, models.Watermark]], None, None]:
+        """
+        Получение всех фильмов диапазона film_work.id для полной переиндексации.
+
+        Диапазон читается по первичному ключу с keyset-пагинацией по id.
+
+        Args:
+            last_id: Последний обработанный id (не включается).
+            max_id: Верхняя граница диапазона (включается).
+
+        Yields:
+            pg_data: Список словарей с данными из PostgreSQL.
+            watermarks: Отметка film_work с последним id пачки.
+        """
+        while True:
             with self.get_pg_conn() as connection, connection.cursor() as cursor:
-                cursor.execute(sql_queries.SQL_QUERY % ids_count, ids)
-                desc = cursor.description
-                column_names = [col[0] for col in desc]
-
-                while pg_data := [dict(zip(column_names, row)) for row in cursor.fetchall()]:
-                    yield pg_data
-        except psycopg2.errors.SyntaxError:
-            logging.info('Отсутствуют данные для обновления Elasticsearch')
+                cursor.execute(sql_queries.SHARD_IDS_QUERY, (last_id, max_id, self.batch_size))
+                ids = [str(row['id']) for row in cursor.fetchall()]
+            if not ids:
+                break
+            last_id = ids[-1]
+            batch = [row for rows in self.get_documents(ids) for row in rows]
+            yield batch, {'film_work': models.Watermark(id=last_id)}
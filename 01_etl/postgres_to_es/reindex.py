@@ -0,0 +1,245 @@
+import argparse
+import logging
+import shutil
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from components import log_config, models, schema, sql_queries, state
+from components.pg_pool import PGConnectionPool
+from components.settings import get_settings
+from data_transform import DataTransformer
+from elastic_loader import ESLoader
+from pg_extractor import PostgresExtractor
+
+log_config.get_log()
+
+
+def get_shards(count: int) -> list[tuple[str, str]]:
+    """Разбиение пространства UUID на равные диапазоны.
+
+    Args:
+        count: Количество диапазонов.
+
+    Returns:
+        shards: Список границ (min_id не включается, max_id включается).
+    """
+    bounds = [str(uuid.UUID(int=(2 ** 128) * shard // count)) for shard in range(count)]
+    return list(zip(bounds, bounds[1:] + [sql_queries.MAX_UUID]))
+
+
+def get_shard_state(shard: int) -> state.State:
+    """Контрольная точка диапазона, в отдельном файле для каждого процесса.
+
+    Args:
+        shard: Номер диапазона.
+
+    Returns:
+        State: Состояние диапазона.
+    """
+    settings = get_settings()
+    path = Path(settings.reindex_state_dir)
+    path.mkdir(parents=True, exist_ok=True)
+    storage = state.JsonFileStorage(
+        str(path / f'shard_{shard}.json'),
+        flush_every=settings.state_flush_every,
+        flush_interval=settings.state_flush_interval,
+    )
+    return state.State(storage)
+
+
+def reindex_shard(shard: int, min_id: str, max_id: str, index_name: str) -> int:
+    """Переиндексация одного диапазона film_work.id в отдельном процессе.
+
+    Работа продолжается с контрольной точки диапазона, которая сохраняется после каждой пачки.
+
+    Args:
+        shard: Номер диапазона.
+        min_id: Нижняя граница диапазона (не включается).
+        max_id: Верхняя граница диапазона (включается).
+        index_name: Индекс, в который загружаются документы.
+
+    Returns:
+        count: Количество загруженных документов.
+    """
+    settings = get_settings()
+    shard_state = get_shard_state(shard)
+    last_id = shard_state.get_watermark('film_work').id
+    if last_id == max_id:
+        logging.info(f'Диапазон {shard} уже загружен')
+        return 0
+    last_id = max(last_id, min_id)
+
+    pg_pool = PGConnectionPool(dsl=settings.dsl_pg, minconn=1, maxconn=2)
+    extractor = PostgresExtractor(pool=pg_pool, state_maneger=shard_state, batch_size=settings.batch_size)
+    transformer = DataTransformer(index_name, settings.json_backend, settings.validate_sample_rate)
+    loader = ESLoader(settings.es_url, index_name, shard_state)
+    count = 0
+    try:
+        for pg_data, watermarks in extractor.get_shard_data(last_id, max_id):
+            loader.push_bulk(bulk=transformer.compile_data(pg_data=pg_data), watermarks=watermarks)
+            count += len(pg_data)
+        shard_state.commit({'film_work': models.Watermark(id=max_id)})
+    finally:
+        shard_state.flush()
+        pg_pool.close()
+        loader.close()
+    logging.info(f'Диапазон {shard} загружен, документов: {count}')
+    return count
+
+
+def reindex(workers: int, shards: int, resume: bool, index_name: str) -> bool:
+    """Полная переиндексация content.film_work пулом процессов.
+
+    Args:
+        workers: Количество процессов.
+        shards: Количество диапазонов film_work.id.
+        resume: Продолжить с контрольных точек предыдущего запуска.
+        index_name: Индекс, в который загружаются документы.
+
+    Returns:
+        bool: Все диапазоны загружены успешно.
+    """
+    settings = get_settings()
+    if not resume:
+        shutil.rmtree(settings.reindex_state_dir, ignore_errors=True)
+    failed = []
+    loader = ESLoader(settings.es_url, index_name)
+    try:
+        with loader.refresh_disabled(index_name), ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(reindex_shard, shard, min_id, max_id, index_name): shard
+                for shard, (min_id, max_id) in enumerate(get_shards(shards))
+            }
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as er:
+                    logging.error(f'Ошибка загрузки диапазона {futures[future]}: {er}')
+                    failed.append(futures[future])
+    finally:
+        loader.close()
+    if failed:
+        logging.error(f'Не загружены диапазоны: {sorted(failed)}, перезапустите с --resume')
+    return not failed
+
+
+def catch_up(catchup_state: state.State, index_name: str) -> None:
+    """Загрузка изменений, сделанных в PostgreSQL во время переиндексации.
+
+    Удаления фильмов за это время применяются по журналу content.film_work_deleted.
+
+    Args:
+        catchup_state: Отметки таблиц, с которых начинается догрузка; сдвигаются по мере загрузки.
+        index_name: Индекс | алиас, в который загружаются документы.
+    """
+    settings = get_settings()
+    pg_pool = PGConnectionPool(dsl=settings.dsl_pg, minconn=1, maxconn=2)
+    extractor = PostgresExtractor(
+        pool=pg_pool,
+        state_maneger=catchup_state,
+        batch_size=settings.batch_size,
+        change_overlap=settings.change_overlap,
+    )
+    transformer = DataTransformer(index_name, settings.json_backend, settings.validate_sample_rate)
+    loader = ESLoader(settings.es_url, index_name, catchup_state)
+    try:
+        for pg_data, watermarks in extractor.get_data():
+            loader.push_bulk(bulk=transformer.compile_data(pg_data=pg_data), watermarks=watermarks)
+        if settings.propagate_deletes:
+            for ids, watermarks in extractor.get_deleted():
+                loader.push_bulk(bulk=transformer.compile_deletes(ids), watermarks=watermarks)
+    finally:
+        pg_pool.close()
+        loader.close()
+
+
+def blue_green_reindex(workers: int, shards: int, resume: bool, delete_old: bool) -> bool:
+    """Переиндексация в новую версию индекса с атомарным переключением алиаса.
+
+    Новый индекс {alias}_v{n} загружается с refresh_interval=-1 и без реплик,
+    затем настройки восстанавливаются, сегменты сливаются и алиас переключается.
+    Чтение через алиас всё это время идёт из предыдущего индекса.
+
+    Args:
+        workers: Количество процессов.
+        shards: Количество диапазонов film_work.id.
+        resume: Продолжить загрузку незавершённого индекса.
+        delete_old: Удалить предыдущие индексы после переключения алиаса.
+
+    Returns:
+        bool: Алиас переключен на новый индекс.
+    """
+    settings = get_settings()
+    alias = settings.es_index
+    path = Path(settings.reindex_state_dir)
+    if not resume:
+        shutil.rmtree(path, ignore_errors=True)
+    path.mkdir(parents=True, exist_ok=True)
+    target = state.JsonFileStorage(str(path / 'target.json'))
+    catchup_state = state.State(state.JsonFileStorage(str(path / 'catchup.json')))
+    loader = ESLoader(settings.es_url, alias)
+    try:
+        target_data = target.retrieve_state()
+        if not target_data:
+            live_settings = (
+                loader.get_index_settings(alias) if loader.connection.indices.exists(index=alias) else {}
+            )
+            target_data = {
+                'index': loader.get_next_version_index(alias),
+                'refresh_interval': schema.ES_SCHEMA['settings']['refresh_interval'],
+                'number_of_replicas': live_settings.get('number_of_replicas', '1'),
+            }
+            if settings.state_backend == 'redis':
+                live_storage = state.RedisStorage()
+            else:
+                live_storage = state.JsonFileStorage(settings.state_file)
+            catchup_state.commit(state.State(live_storage).document.watermarks)
+            loader.push_index(target_data['index'], {'refresh_interval': '-1', 'number_of_replicas': 0})
+            target.save_state(target_data)
+            logging.info(f'Создан индекс {target_data["index"]}')
+        index_name = target_data['index']
+
+        if not reindex(workers, shards, resume=True, index_name=index_name):
+            return False
+        catch_up(catchup_state, index_name)
+        loader.put_index_settings(index_name, {
+            'refresh_interval': target_data['refresh_interval'],
+            'number_of_replicas': target_data['number_of_replicas'],
+        })
+        loader.forcemerge(index_name)
+        old_indices = loader.swap_alias(alias, index_name)
+        logging.info(f'Алиас {alias} переключен на {index_name}')
+        catch_up(catchup_state, alias)
+        if delete_old and old_indices:
+            loader.connection.indices.delete(index=','.join(old_indices))
+            logging.info(f'Удалены индексы: {old_indices}')
+    finally:
+        loader.close()
+    shutil.rmtree(path, ignore_errors=True)
+    return True
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Полная переиндексация movies в несколько процессов.')
+    parser.add_argument('--workers', type=int, default=get_settings().reindex_workers)
+    parser.add_argument('--shards', type=int, default=None, help='По умолчанию workers * 4.')
+    parser.add_argument(
+        '--resume',
+        action='store_true',
+        help='Продолжить с контрольных точек (с тем же --shards).',
+    )
+    parser.add_argument(
+        '--alias',
+        action='store_true',
+        help='Загрузить новую версию индекса и переключить на неё алиас ES_INDEX.',
+    )
+    parser.add_argument('--delete-old', action='store_true', help='Удалить предыдущие версии индекса (с --alias).')
+    args = parser.parse_args()
+    shards = args.shards or args.workers * 4
+    if args.alias:
+        is_done = blue_green_reindex(args.workers, shards, args.resume, args.delete_old)
+    else:
+        is_done = reindex(args.workers, shards, args.resume, get_settings().es_index)
+    if not is_done:
+        raise SystemExit(1)
@@ -1,2 +1,2 @@
 #!/bin/sh
-python3 main.py
\ No newline at end of file
+exec python3 main.py
\ No newline at end of file
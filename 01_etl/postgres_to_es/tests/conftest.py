@@ -0,0 +1,17 @@
+import os
+
+# Settings читает окружение при импорте; значения для тестов без .env.
+TEST_ENV = {
+    'DB_HOST': 'localhost',
+    'DB_NAME': 'movies_database',
+    'DB_USER': 'app',
+    'DB_PASSWORD': 'app',
+    'DB_PORT': '5432',
+    'REDIS_HOST': 'localhost',
+    'REDIS_PORT': '6379',
+    'REDIS_DB': '0',
+    'STATE_KEY': 'key',
+}
+
+for name, value in TEST_ENV.items():
+    os.environ.setdefault(name, value)
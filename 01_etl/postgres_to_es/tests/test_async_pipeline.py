@@ -0,0 +1,55 @@
+import asyncio
+import threading
+
+from async_pipeline import AsyncPipeline
+from components.state import State
+from tests.test_state import MemoryStorage
+
+
+class Service:
+    def __init__(self) -> None:
+        self.stop_event = threading.Event()
+        self.state_maneger = State(MemoryStorage({}))
+        self.hash_index = None
+
+
+class Loader:
+    def __init__(self, delays: dict[bytes, float]) -> None:
+        self.delays = delays
+        self.started = []
+        self.finished = []
+
+    async def push_bulk(self, bulk: list[bytes]) -> set[str]:
+        self.started.append(bulk[0])
+        await asyncio.sleep(self.delays.get(bulk[0], 0))
+        self.finished.append(bulk[0])
+        return set()
+
+
+def run_load(loader: Loader, kinds: list[tuple[bytes, str]]) -> None:
+    async def load() -> None:
+        queue = asyncio.Queue()
+        for seq, (operation, kind) in enumerate(kinds):
+            queue.put_nowait((seq, [operation], {}, {}, kind))
+        queue.put_nowait(None)
+        await AsyncPipeline(Service(), loader, queue_size=10, concurrency=4).load(queue)
+
+    asyncio.run(load())
+
+
+def test_index_batches_are_sent_concurrently():
+    loader = Loader({b'index-1': 0.02})
+    run_load(loader, [(b'index-1', 'index'), (b'index-2', 'index')])
+    assert loader.finished == [b'index-2', b'index-1']
+
+
+def test_delete_waits_for_earlier_index_batches():
+    loader = Loader({b'index-1': 0.02, b'update-1': 0.01})
+    run_load(loader, [
+        (b'index-1', 'index'),
+        (b'index-2', 'index'),
+        (b'update-1', 'update'),
+        (b'update-2', 'update'),
+        (b'delete-1', 'delete'),
+    ])
+    assert loader.finished == [b'index-2', b'index-1', b'update-1', b'update-2', b'delete-1']
@@ -0,0 +1,22 @@
+from components.hash_index import JsonFileHashIndex
+
+
+def test_compaction_keeps_hashes(tmp_path, monkeypatch):
+    monkeypatch.setattr(JsonFileHashIndex, 'compact_lines', 3)
+    file_path = tmp_path / 'hashes.jsonl'
+    index = JsonFileHashIndex(str(file_path))
+    for number in range(5):
+        index.update({str(number): f'hash{number}'})
+    index.delete(['0'])
+    assert index.lines <= 3
+    assert not list(tmp_path.glob('.*.tmp'))
+    reloaded = JsonFileHashIndex(str(file_path))
+    assert reloaded.get_many(str(number) for number in range(5)) == {
+        str(number): f'hash{number}' for number in range(1, 5)
+    }
+
+
+def test_truncated_line_is_skipped(tmp_path):
+    file_path = tmp_path / 'hashes.jsonl'
+    file_path.write_text('{"1": "a"}\n{"2": "b', encoding='utf-8')
+    assert JsonFileHashIndex(str(file_path)).get_many(['1', '2']) == {'1': 'a'}
@@ -0,0 +1,41 @@
+import fakeredis
+import pytest
+
+from components.leases import LeaseManager
+
+TABLES = ['film_work', 'person', 'genre', 'film_work_deleted']
+
+
+@pytest.fixture
+def server():
+    return fakeredis.FakeServer()
+
+
+def make_manager(server, owner: str) -> LeaseManager:
+    return LeaseManager(fakeredis.FakeRedis(server=server, decode_responses=True), 'etl', ttl=60, owner=owner)
+
+
+def test_single_replica_takes_all_tables(server):
+    assert make_manager(server, 'a').acquire_many(TABLES) == set(TABLES)
+
+
+def test_replicas_split_tables_fairly(server):
+    first = make_manager(server, 'a')
+    second = make_manager(server, 'b')
+    first.acquire_many(TABLES)
+    assert second.acquire_many(TABLES) == set()
+    first_tables = first.acquire_many(TABLES)
+    second_tables = second.acquire_many(TABLES)
+    assert len(first_tables) == len(second_tables) == 2
+    assert first_tables | second_tables == set(TABLES)
+
+
+def test_tables_return_after_replica_stops(server):
+    first = make_manager(server, 'a')
+    second = make_manager(server, 'b')
+    first.acquire_many(TABLES)
+    second.acquire_many(TABLES)
+    first.acquire_many(TABLES)
+    second.acquire_many(TABLES)
+    second.release_all()
+    assert first.acquire_many(TABLES) == set(TABLES)
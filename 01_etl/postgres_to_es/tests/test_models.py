@@ -0,0 +1,33 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from components.models import Watermark, parse_modified
+from components.sql_queries import MIN_MODIFIED
+
+
+@pytest.mark.parametrize(
+    ('value', 'expected'),
+    [
+        ('2021-01-01 00:0:00.000001', datetime(2021, 1, 1, 0, 0, 0, 1, tzinfo=timezone.utc)),
+        (MIN_MODIFIED, datetime(2021, 1, 1, 0, 0, 0, 1, tzinfo=timezone.utc)),
+        ('2022-06-01T10:20:30+00:00', datetime(2022, 6, 1, 10, 20, 30, tzinfo=timezone.utc)),
+        (
+            '2022-06-01 10:20:30.5+03',
+            datetime(2022, 6, 1, 10, 20, 30, 500000, tzinfo=timezone(timedelta(hours=3))),
+        ),
+    ],
+)
+def test_parse_modified(value, expected):
+    assert parse_modified(value) == expected
+
+
+def test_parse_modified_rejects_garbage():
+    with pytest.raises(ValueError):
+        parse_modified('garbage')
+
+
+def test_watermark_key_orders_postgres_and_python_formats():
+    postgres = Watermark(modified='2022-06-01 10:20:30.000001+00')
+    python = Watermark(modified='2022-06-01 10:20:30+00:00')
+    assert postgres.key() > python.key()
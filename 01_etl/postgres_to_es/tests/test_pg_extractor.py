@@ -0,0 +1,73 @@
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from uuid import UUID
+
+from components.models import Watermark
+from components.state import State
+from pg_extractor import PostgresExtractor
+from tests.test_state import MemoryStorage
+
+
+class Cursor:
+    def __init__(self, rows: list[dict]) -> None:
+        self.rows = rows
+        self.result = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> None:
+        pass
+
+    def execute(self, query: str, params: tuple) -> None:
+        modified, last_id, limit = params
+        start = (datetime.fromisoformat(modified), UUID(last_id))
+        self.result = [row for row in self.rows if (row['modified'], row['id']) > start][:limit]
+
+    def fetchall(self) -> list[dict]:
+        return self.result
+
+
+class Pool:
+    def __init__(self, rows: list[dict]) -> None:
+        self.rows = rows
+
+    @contextmanager
+    def connection(self):
+        yield self
+
+    def cursor(self) -> Cursor:
+        return Cursor(self.rows)
+
+
+def make_rows(modified: datetime, count: int) -> list[dict]:
+    return [{'modified': modified, 'id': UUID(int=number + 1)} for number in range(count)]
+
+
+def test_reread_pages_are_skipped_only_when_requested():
+    modified = datetime.now(timezone.utc) - timedelta(seconds=1)
+    rows = make_rows(modified, 3)
+    state = State(MemoryStorage({}))
+    state.commit({'person': Watermark(modified=str(modified), id=str(rows[-1]['id']))})
+    extractor = PostgresExtractor(Pool(rows), state, batch_size=2, change_overlap=10)
+
+    assert [ids for ids, _ in extractor.get_changed_ids('person')] == [
+        [str(rows[0]['id']), str(rows[1]['id'])],
+        [str(rows[2]['id'])],
+    ]
+    assert list(extractor.get_changed_ids('person', skip_reread=True)) == []
+
+
+def test_new_page_in_overlap_window_is_not_skipped():
+    modified = datetime.now(timezone.utc) - timedelta(seconds=1)
+    rows = make_rows(modified, 3)
+    state = State(MemoryStorage({}))
+    state.commit({'person': Watermark(modified=str(modified), id=str(rows[0]['id']))})
+    extractor = PostgresExtractor(Pool(rows), state, batch_size=2, change_overlap=10)
+
+    pages = list(extractor.get_changed_ids('person', skip_reread=True))
+    assert [ids for ids, _ in pages] == [
+        [str(rows[0]['id']), str(rows[1]['id'])],
+        [str(rows[2]['id'])],
+    ]
+    assert state.advances(pages[-1][1])
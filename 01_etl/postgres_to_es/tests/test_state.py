@@ -0,0 +1,37 @@
+from components.models import Watermark
+from components.sql_queries import MIN_MODIFIED, MIN_UUID
+from components.state import BaseStorage, State
+
+
+class MemoryStorage(BaseStorage):
+    def __init__(self, state: dict) -> None:
+        self.state = state
+
+    def save_state(self, state: dict) -> None:
+        self.state = state
+
+    def retrieve_state(self) -> dict:
+        return dict(self.state)
+
+
+def test_legacy_watermark_is_normalized():
+    state = State(MemoryStorage({'key_film_work': '2021-01-01 00:0:00.000001'}))
+    watermark = state.get_watermark('film_work')
+    assert watermark.modified == '2021-01-01 00:00:00.000001+00:00'
+    state.commit({'film_work': watermark.copy(update={'modified': '2022-01-01 00:00:00+00'})})
+    assert state.get_watermark('film_work').modified == '2022-01-01 00:00:00+00'
+
+
+def test_unparsable_legacy_watermark_falls_back_to_min_modified():
+    state = State(MemoryStorage({'key': 'not a date'}))
+    assert state.get_watermark('film_work').modified == MIN_MODIFIED
+
+
+def test_advances_only_past_stored_watermark():
+    state = State(MemoryStorage({}))
+    state.commit({'film_work': Watermark(modified='2022-01-01 00:00:00+00', id=MIN_UUID)})
+    assert not state.advances({})
+    assert not state.advances({'film_work': Watermark(modified='2022-01-01 00:00:00+00:00', id=MIN_UUID)})
+    assert not state.advances({'film_work': Watermark(modified='2021-12-31 23:59:59+00', id=MIN_UUID)})
+    assert state.advances({'film_work': Watermark(modified='2022-01-01 00:00:01+00', id=MIN_UUID)})
+    assert state.advances({'person': Watermark(modified='2021-06-01 00:00:00+00', id=MIN_UUID)})
@@ -0,0 +1,173 @@
+import psycopg2
+import pytest
+
+from components import utilities
+from components.utilities import CircuitBreaker, CircuitOpenError, RetryBudget, RetryBudgetExceeded, backoff
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(utilities.time, 'monotonic', clock)
+    return clock
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(utilities.time, 'sleep', sleeps.append)
+    return sleeps
+
+
+@pytest.fixture(autouse=True)
+def registry(monkeypatch):
+    monkeypatch.setattr(utilities, '_breakers', {})
+    monkeypatch.setattr(utilities, '_budgets', {})
+    utilities.retry_stats.clear()
+
+
+def test_breaker_opens_after_threshold(clock):
+    breaker = CircuitBreaker('postgres', failure_threshold=3, reset_timeout=10)
+    for _ in range(2):
+        breaker.record_failure()
+        assert breaker.allow()
+    breaker.record_failure()
+    assert not breaker.allow()
+    assert breaker.remaining() == 10
+
+
+def test_breaker_success_resets_failures(clock):
+    breaker = CircuitBreaker('postgres', failure_threshold=2, reset_timeout=10)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.allow()
+
+
+def test_breaker_half_open_allows_single_probe(clock):
+    breaker = CircuitBreaker('postgres', failure_threshold=1, reset_timeout=10)
+    breaker.record_failure()
+    clock.now += 10
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.allow()
+
+
+def test_breaker_failed_probe_reopens(clock):
+    breaker = CircuitBreaker('postgres', failure_threshold=1, reset_timeout=10)
+    breaker.record_failure()
+    clock.now += 10
+    assert breaker.allow()
+    breaker.record_failure()
+    assert not breaker.allow()
+    assert breaker.remaining() == 10
+
+
+def test_retry_budget_min_retries(clock):
+    budget = RetryBudget(ratio=0.1, min_retries=2, window=60)
+    budget.record_call()
+    assert budget.withdraw()
+    assert budget.withdraw()
+    assert not budget.withdraw()
+
+
+def test_retry_budget_ratio(clock):
+    budget = RetryBudget(ratio=0.5, min_retries=0, window=60)
+    for _ in range(4):
+        budget.record_call()
+    assert budget.withdraw()
+    assert budget.withdraw()
+    assert not budget.withdraw()
+
+
+def test_retry_budget_window_rolls(clock):
+    budget = RetryBudget(ratio=0, min_retries=1, window=60)
+    assert budget.withdraw()
+    assert not budget.withdraw()
+    clock.now += 60
+    assert budget.withdraw()
+
+
+def test_backoff_full_jitter_bounds(monkeypatch, clock, sleeps):
+    bounds = []
+
+    def uniform(low, high):
+        bounds.append((low, high))
+        return high
+
+    monkeypatch.setattr(utilities.random, 'uniform', uniform)
+    calls = []
+
+    @backoff(start_sleep_time=0.1, factor=2, border_sleep_time=0.5, max_repeat=10, logger=lambda: None)
+    def flaky():
+        calls.append(1)
+        if len(calls) <= 4:
+            raise psycopg2.OperationalError('down')
+        return 'ok'
+
+    assert flaky() == 'ok'
+    assert bounds == [(0, 0.1), (0, 0.2), (0, 0.4), (0, 0.5)]
+    assert sleeps == [0.1, 0.2, 0.4, 0.5]
+
+
+def test_backoff_rejects_when_circuit_open(clock, sleeps):
+    utilities.get_circuit_breaker('postgres').opened_at = clock.now
+
+    @backoff(logger=lambda: None, dependency='postgres')
+    def query():
+        return 'ok'
+
+    with pytest.raises(CircuitOpenError):
+        query()
+
+
+def test_backoff_stops_when_budget_exhausted(clock, sleeps):
+    utilities._budgets['postgres'] = RetryBudget(ratio=0, min_retries=1)
+
+    @backoff(logger=lambda: None, dependency='postgres', max_repeat=10)
+    def query():
+        raise psycopg2.OperationalError('down')
+
+    with pytest.raises(RetryBudgetExceeded):
+        query()
+    assert len(sleeps) == 1
+
+
+def test_backoff_generator_records_nothing_until_iterated(clock, sleeps):
+    breaker = utilities.get_circuit_breaker('postgres')
+    breaker.failures = 4
+
+    @backoff(logger=lambda: None, dependency='postgres')
+    def rows():
+        yield 1
+
+    generator = rows()
+    assert breaker.failures == 4
+    assert list(generator) == [1]
+    assert breaker.failures == 0
+
+
+def test_backoff_generator_retries_iteration(clock, sleeps):
+    runs = []
+
+    @backoff(logger=lambda: None, dependency='postgres')
+    def rows():
+        runs.append(1)
+        yield 1
+        if len(runs) == 1:
+            raise psycopg2.OperationalError('down')
+        yield 2
+
+    assert list(rows()) == [1, 1, 2]
+    assert len(runs) == 2
+    assert len(sleeps) == 1
+    assert utilities.retry_stats['postgres']['retries'] == 1